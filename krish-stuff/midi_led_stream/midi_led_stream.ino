@@ -1,6 +1,23 @@
 
-// Arduino streaming receiver for "E,<note>,<duration>\n" commands
+// Arduino streaming receiver for note commands from midi_stream_to_arduino.py
 // Non-blocking scheduling supports overlapping notes.
+//
+// Wire formats accepted at any time (see syoma_stuf/device_protocol.py):
+//   ASCII:  "E,<note>,<duration>\n", fired on arrival
+//   Binary: 6-byte frame [0xA5, note, duration lo, duration hi, velocity, checksum],
+//           fired on arrival
+//   Timed:  10-byte frame [0xA6, note, duration lo, duration hi, velocity,
+//           at ms (4 bytes, little endian), checksum], queued and fired at
+//           <at ms> after the last "S" command on our own millis() clock
+//   checksum = XOR of every byte between the sync byte and the checksum
+// Control lines: "P,B" -> "OK,B", "P,T" -> "OK,T,<slots>", "S" starts the
+// clock, "X" clears the queue and all LEDs -> "R,<slots>".
+// Each time queued notes fire we send "C,<n>" to hand n queue slots back to
+// the host (credit-based flow control), so the queue can never overflow.
+// A timed frame we reject (bad checksum, queue full, cut off) still costs the
+// host a credit, so it is handed back with "C,1" too. Input that stalls
+// mid-frame or mid-line is dropped so the parser gets back in step.
+// Parsing uses fixed buffers only (no String), so the heap never fragments.
 
 const unsigned long SERIAL_TIMEOUT_MS = 100; // not used but nice to know
 
@@ -23,7 +40,34 @@ struct Active {
 const int MAX_ACTIVE = 32;
 Active active[MAX_ACTIVE];
 
-String inputBuf = "";
+// Timed notes waiting for their fire time
+struct Queued {
+  bool inUse;
+  byte note;
+  unsigned int dur;
+  unsigned long at; // ms after streamStart
+};
+const int QUEUE_SLOTS = 32;
+Queued queued[QUEUE_SLOTS];
+unsigned long streamStart = 0;
+
+// ASCII line buffer
+const int LINE_MAX = 32;
+char lineBuf[LINE_MAX];
+int lineLen = 0;
+
+// Binary frame buffer; frameLen > 0 while a frame is being received
+const byte FRAME_SYNC = 0xA5;
+const byte TIMED_FRAME_SYNC = 0xA6;
+const int FRAME_LEN = 6;
+const int TIMED_FRAME_LEN = 10;
+byte frame[TIMED_FRAME_LEN];
+int frameLen = 0;
+int frameExpected = 0;
+
+// The host writes each frame or line in one go; a gap this long inside one means bytes were lost
+const unsigned long STALE_INPUT_MS = 5;
+unsigned long lastByteAt = 0;
 
 void setup() {
   Serial.begin(115200);
@@ -34,26 +78,65 @@ void setup() {
   for (int i = 0; i < MAX_ACTIVE; ++i) {
     active[i].inUse = false;
   }
+  for (int i = 0; i < QUEUE_SLOTS; ++i) {
+    queued[i].inUse = false;
+  }
 }
 
 void loop() {
+  if ((frameLen > 0 || lineLen > 0) && millis() - lastByteAt > STALE_INPUT_MS) {
+    if (frameLen > 0 && frame[0] == TIMED_FRAME_SYNC) returnCredit();
+    frameLen = 0;
+    lineLen = 0;
+  }
+
   // read incoming serial
   while (Serial.available()) {
-    char c = (char)Serial.read();
-    if (c == '\n') {
-      processLine(inputBuf);
-      inputBuf = "";
+    byte c = (byte)Serial.read();
+    lastByteAt = millis();
+    if (frameLen > 0) {
+      frame[frameLen++] = c;
+      if (frameLen == frameExpected) {
+        if (frame[0] == TIMED_FRAME_SYNC) processTimedFrame();
+        else processFrame();
+        frameLen = 0;
+      }
+    } else if ((c == FRAME_SYNC || c == TIMED_FRAME_SYNC) && lineLen == 0) {
+      frame[0] = c;
+      frameLen = 1;
+      frameExpected = (c == TIMED_FRAME_SYNC) ? TIMED_FRAME_LEN : FRAME_LEN;
+    } else if (c == '\n') {
+      lineBuf[lineLen] = '\0';
+      processLine(lineBuf);
+      lineLen = 0;
     } else if (c >= 32) {
-      inputBuf += c;
-      if (inputBuf.length() > 120) {
+      if (lineLen < LINE_MAX - 1) {
+        lineBuf[lineLen++] = (char)c;
+      } else {
         // avoid runaway huge line
-        inputBuf = "";
+        lineLen = 0;
       }
     }
   }
 
-  // Check active notes to turn off
   unsigned long now = millis();
+
+  // Fire queued notes that are due and hand their slots back to the host
+  int freed = 0;
+  for (int i = 0; i < QUEUE_SLOTS; ++i) {
+    if (queued[i].inUse && (long)(now - (streamStart + queued[i].at)) >= 0) {
+      queued[i].inUse = false;
+      triggerNote(queued[i].note, queued[i].dur);
+      ++freed;
+    }
+  }
+  if (freed > 0) {
+    Serial.print("C,");
+    Serial.print(freed);
+    Serial.print("\n");
+  }
+
+  // Check active notes to turn off
   for (int i = 0; i < MAX_ACTIVE; ++i) {
     if (active[i].inUse && (long)(now - active[i].offAt) >= 0) {
       digitalWrite(active[i].pin, LOW);
@@ -62,19 +145,92 @@ void loop() {
   }
 }
 
-void processLine(const String &line) {
+void processFrame() {
+  // frame: [sync, note, dur lo, dur hi, velocity, checksum]
+  byte checksum = frame[1] ^ frame[2] ^ frame[3] ^ frame[4];
+  if (checksum != frame[5]) return; // corrupted, drop it
+  unsigned long dur = (unsigned long)frame[2] | ((unsigned long)frame[3] << 8);
+  triggerNote(frame[1], dur);
+}
+
+void processTimedFrame() {
+  // frame: [sync, note, dur lo, dur hi, velocity, at0, at1, at2, at3, checksum]
+  byte checksum = 0;
+  for (int i = 1; i < TIMED_FRAME_LEN - 1; ++i) checksum ^= frame[i];
+  if (checksum != frame[TIMED_FRAME_LEN - 1]) {
+    returnCredit(); // corrupted, drop it
+    return;
+  }
+  for (int i = 0; i < QUEUE_SLOTS; ++i) {
+    if (!queued[i].inUse) {
+      queued[i].inUse = true;
+      queued[i].note = frame[1];
+      queued[i].dur = (unsigned int)frame[2] | ((unsigned int)frame[3] << 8);
+      queued[i].at = (unsigned long)frame[5] | ((unsigned long)frame[6] << 8)
+                   | ((unsigned long)frame[7] << 16) | ((unsigned long)frame[8] << 24);
+      return;
+    }
+  }
+  // queue full: the host sent more than its credits, drop it
+  returnCredit();
+}
+
+// Hand the slot of a rejected timed frame back to the host
+void returnCredit() {
+  Serial.print("C,1\n");
+}
+
+void clearQueue() {
+  for (int i = 0; i < QUEUE_SLOTS; ++i) queued[i].inUse = false;
+  for (int i = 0; i < MAX_ACTIVE; ++i) {
+    if (active[i].inUse) {
+      digitalWrite(active[i].pin, LOW);
+      active[i].inUse = false;
+    }
+  }
+}
+
+// Parse a non-negative decimal number at *p, advancing p past it
+long parseNumber(const char *&p) {
+  long value = 0;
+  while (*p >= '0' && *p <= '9') {
+    value = value * 10 + (*p - '0');
+    ++p;
+  }
+  return value;
+}
+
+void processLine(const char *line) {
+  // Protocol requests: P,B -> binary frames, P,T -> timed frames supported
+  if (line[0] == 'P' && line[1] == ',' && line[3] == '\0') {
+    if (line[2] == 'B') {
+      Serial.print("OK,B\n");
+    } else if (line[2] == 'T') {
+      Serial.print("OK,T,");
+      Serial.print(QUEUE_SLOTS);
+      Serial.print("\n");
+    }
+    return;
+  }
+  // S: start the timed clock, X: clear the queue and hand every slot back
+  if (line[0] == 'S' && line[1] == '\0') {
+    streamStart = millis();
+    return;
+  }
+  if (line[0] == 'X' && line[1] == '\0') {
+    clearQueue();
+    Serial.print("R,");
+    Serial.print(QUEUE_SLOTS);
+    Serial.print("\n");
+    return;
+  }
   // Expect lines like: E,60,250
-  if (line.length() == 0) return;
-  if (line.charAt(0) != 'E') return;
-  Serial.println("Received: " + line); // Debug print
-  // crude parse
-  int firstComma = line.indexOf(',');
-  int secondComma = line.indexOf(',', firstComma+1);
-  if (firstComma < 0 || secondComma < 0) return;
-  String noteStr = line.substring(firstComma+1, secondComma);
-  String durStr = line.substring(secondComma+1);
-  int note = noteStr.toInt();
-  unsigned long dur = (unsigned long)durStr.toInt();
+  if (line[0] != 'E' || line[1] != ',') return;
+  const char *p = line + 2;
+  int note = (int)parseNumber(p);
+  if (*p != ',') return;
+  ++p;
+  unsigned long dur = (unsigned long)parseNumber(p);
   triggerNote(note, dur);
 }
 
@@ -92,4 +248,4 @@ void triggerNote(int note, unsigned long dur_ms) {
     }
   }
   // no free slot: ignore or replace oldest (we ignore for now)
-}
\ No newline at end of file
+}
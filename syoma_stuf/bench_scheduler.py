@@ -0,0 +1,183 @@
+"""
+Scheduler Timing Benchmark
+Plays MIDI files through the real streaming path into a fake serial device
+(the idea of krish-stuff/test copy.py's DummySerial, plus timestamps). The
+device models the UART: each "E,..." line is stamped when its last byte
+would have arrived at the given baud rate, queued behind anything still on
+the wire. Onset error is that arrival time minus the note's ideal time on
+the scheduler's clock, reported as p50/p95/p99/max of the absolute error
+plus the drift between the start and the end of each run.
+
+Runs the files in assets/midi_datatbase and two synthetic stress files
+(dense chords, fast runs) at several playback speeds. Needs no hardware,
+so scheduler changes can be compared on a plain Linux box
+"""
+import argparse
+import contextlib
+import io
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+import mido
+import numpy as np
+import serial
+
+import midi_stream_to_arduino as mid
+from midi_timeline import load_timeline
+
+DEFAULT_MIDI_FOLDER = Path(__file__).parent.parent / "assets" / "midi_datatbase"
+SPEEDS = [0.5, 1.0, 2.0]
+FAKE_PORT = "FAKE0"
+
+
+class FakeSerialDevice:
+    """Stands in for serial.Serial: silent to protocol requests (so it gets ASCII), timestamps every note line"""
+
+    def __init__(self, port=None, baudrate=115200, timeout=None, **kwargs):
+        self.port = port
+        self.baudrate = baudrate
+        self.timeout = timeout or 0.0
+        self.is_open = True
+        self.in_waiting = 0
+        self.lines = []  # (write time, arrival time, line) on the perf_counter clock
+        self._wire_free = 0.0  # when the last queued byte finishes shifting out
+        self._partial = b""
+
+    def write(self, data):
+        now = time.perf_counter()
+        byte_time = 10.0 / self.baudrate  # start + 8 data + stop bits
+        start = max(now, self._wire_free)
+        self._wire_free = start + len(data) * byte_time
+        buffer = self._partial + data
+        offset = -len(self._partial)
+        while True:
+            end = buffer.find(b"\n")
+            if end < 0:
+                break
+            line = buffer[:end]
+            if line.startswith(b"E,"):
+                self.lines.append((now, start + (offset + end + 1) * byte_time, line))
+            buffer = buffer[end + 1:]
+            offset += end + 1
+        self._partial = buffer
+        return len(data)
+
+    def readline(self):
+        time.sleep(self.timeout)
+        return b""
+
+    def reset_input_buffer(self):
+        pass
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.is_open = False
+
+
+def make_synthetic_files(folder, seconds=10.0):
+    """Write the stress files into folder and return their paths"""
+    def write(name, notes):
+        # notes: (onset s, note, duration s) -> a single-track file at 120 BPM
+        midi = mido.MidiFile(ticks_per_beat=480)
+        track = mido.MidiTrack()
+        midi.tracks.append(track)
+        ticks_per_second = 2 * midi.ticks_per_beat
+        messages = []
+        for onset, note, duration in notes:
+            messages.append((int(round(onset * ticks_per_second)), 1, note))
+            messages.append((int(round((onset + duration) * ticks_per_second)), 0, note))
+        messages.sort()
+        last = 0
+        for tick, on, note in messages:
+            track.append(mido.Message('note_on' if on else 'note_off', note=note,
+                                      velocity=90 if on else 0, time=tick - last))
+            last = tick
+        path = Path(folder) / name
+        midi.save(path)
+        return path
+
+    chord = [60, 64, 67, 71, 62, 65]
+    dense = [(0.1 * i, note, 0.08) for i in range(int(seconds / 0.1)) for note in chord]
+    fast = [(0.025 * i, 60 + i % 12, 0.02) for i in range(int(seconds / 0.025))]
+    return [write("synthetic-dense-chords.mid", dense), write("synthetic-fast-run.mid", fast)]
+
+
+def run_once(midi_file, speed, song_seconds, baud):
+    """
+    Play up to song_seconds of midi_file at speed into the fake device
+
+    Returns:
+        Dict with the event count and onset error stats in milliseconds
+    """
+    with contextlib.redirect_stdout(io.StringIO()):
+        device = mid._serial_pool.get(FAKE_PORT, baud)
+        device.lines.clear()
+        device._wire_free = 0.0
+        session = mid.play_midi(str(midi_file), start_time=0.0, playback_speed=speed,
+                                port=FAKE_PORT, baud=baud, protocol="ascii")
+        session.thread.join(timeout=song_seconds / speed + 1.0)
+        if session.is_alive():
+            session.stop(timeout=2.0)
+    lines = list(device.lines)
+
+    # Notes go out in onset order, so the k-th line belongs to the k-th onset
+    onsets = np.sort(load_timeline(midi_file).onset)
+    count = min(len(lines), int(np.searchsorted(onsets, song_seconds)))
+    if count == 0:
+        return {'events': 0}
+    ideal = session.scheduler.origin + onsets[:count] / speed
+    arrival = np.array([line[1] for line in lines[:count]])
+    error_ms = 1000.0 * (arrival - ideal)
+    absolute = np.abs(error_ms)
+    edge = max(count // 10, 1)
+    return {
+        'events': count,
+        'p50_ms': float(np.percentile(absolute, 50)),
+        'p95_ms': float(np.percentile(absolute, 95)),
+        'p99_ms': float(np.percentile(absolute, 99)),
+        'max_ms': float(absolute.max()),
+        'mean_ms': float(error_ms.mean()),
+        'drift_ms': float(np.median(error_ms[-edge:]) - np.median(error_ms[:edge])),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure scheduler onset error against a fake serial device")
+    parser.add_argument("files", nargs="*", help="MIDI files (default: the MIDI database plus synthetic files)")
+    parser.add_argument("--speeds", type=float, nargs="+", default=SPEEDS)
+    parser.add_argument("--seconds", type=float, default=10.0, help="song seconds to play per run")
+    parser.add_argument("--baud", type=int, default=115200)
+    parser.add_argument("--no-synthetic", action="store_true")
+    args = parser.parse_args()
+
+    serial.Serial = FakeSerialDevice  # the pool opens ports through serial.Serial
+    mid._serial_pool.reset_delay = 0.0  # no Arduino to wait for
+
+    temp_folder = Path(tempfile.mkdtemp(prefix="bench_scheduler_"))
+    try:
+        files = [Path(f) for f in args.files] or sorted(DEFAULT_MIDI_FOLDER.glob("*.mid"))
+        if not args.no_synthetic:
+            files += make_synthetic_files(temp_folder, args.seconds)
+
+        print(f"{'file':32} {'speed':>5} {'events':>6} {'p50':>7} {'p95':>7} {'p99':>7} "
+              f"{'max':>7} {'mean':>7} {'drift':>7}  (ms, device arrival vs ideal onset)")
+        for midi_file in files:
+            for speed in args.speeds:
+                r = run_once(midi_file, speed, args.seconds, args.baud)
+                if not r['events']:
+                    print(f"{midi_file.stem[:32]:32} {speed:>5.2f} {'no events received':>20}")
+                    continue
+                print(f"{midi_file.stem[:32]:32} {speed:>5.2f} {r['events']:>6} {r['p50_ms']:>7.2f} "
+                      f"{r['p95_ms']:>7.2f} {r['p99_ms']:>7.2f} {r['max_ms']:>7.2f} "
+                      f"{r['mean_ms']:>7.2f} {r['drift_ms']:>7.2f}")
+    finally:
+        mid.close_serial_connections()
+        shutil.rmtree(temp_folder, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
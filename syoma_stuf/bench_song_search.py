@@ -0,0 +1,141 @@
+"""
+Song Search Benchmark
+Builds synthetic MIDI libraries of 1k/10k/100k names (empty .mid files in a
+temporary folder), then times SongCatalog loading and searching with exact,
+partial and misspelled queries, and checks the bounded search against an
+exhaustive scan
+"""
+import argparse
+import random
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from song_search import SongCatalog
+
+LIBRARY_SIZES = [1000, 10000, 100000]
+SYLLABLES = ["ka", "lo", "mi", "ra", "ne", "to", "su", "vi", "de", "an", "bel", "cor",
+             "dra", "el", "fin", "gor", "han", "is", "jo", "ley", "mar", "nos", "or",
+             "pen", "quin", "ros", "sta", "tri", "ul", "ven", "wil", "xa", "yon", "zel"]
+
+
+def _word(rng):
+    return "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(1, 3)))
+
+
+def make_names(count, seed=0):
+    """count distinct "Artist - Title words" song names"""
+    rng = random.Random(seed)
+    artists = [f"{_word(rng)} {_word(rng)}".title() for _ in range(max(count // 20, 10))]
+    names = set()
+    while len(names) < count:
+        title = " ".join(_word(rng) for _ in range(rng.randint(1, 5)))
+        names.add(f"{rng.choice(artists)} - {title.title()}")
+    return sorted(names)
+
+
+def _misspell(text, rng, edits=2):
+    """Apply random substitutions, deletions and transpositions, like a bad transcription"""
+    chars = list(text)
+    for _ in range(edits):
+        if len(chars) < 3:
+            break
+        i = rng.randrange(len(chars) - 1)
+        kind = rng.randrange(3)
+        if kind == 0:
+            chars[i] = rng.choice("abcdefghijklmnopqrstuvwxyz")
+        elif kind == 1:
+            del chars[i]
+        else:
+            chars[i], chars[i + 1] = chars[i + 1], chars[i]
+    return "".join(chars)
+
+
+def make_queries(names, count, seed=1):
+    """(kind, query) pairs: exact titles, partial titles and misspelled titles"""
+    rng = random.Random(seed)
+    queries = []
+    for i in range(count):
+        title = rng.choice(names).split(" - ", 1)[1].lower()
+        kind = ("exact", "partial", "misspelled")[i % 3]
+        if kind == "partial":
+            words = title.split()
+            title = " ".join(words[:max(1, len(words) - 1)])
+        elif kind == "misspelled":
+            title = _misspell(title, rng)
+        queries.append((kind, title))
+    return queries
+
+
+def bench_library(size, queries=300, check=20, top_n=5):
+    """
+    Time one synthetic library
+
+    Returns:
+        Dict with load time, per-query p50/p99/max in ms and how many of the
+        checked queries ranked the same as an exhaustive scan
+    """
+    names = make_names(size)
+    folder = Path(tempfile.mkdtemp(prefix="bench_song_search_"))
+    try:
+        for name in names:
+            (folder / f"{name}.mid").touch()
+
+        start = time.perf_counter()
+        catalog = SongCatalog(folder, poll_interval=3600)
+        load_s = time.perf_counter() - start
+
+        query_list = make_queries(names, queries)
+        timings = []
+        for _, query in query_list:
+            start = time.perf_counter()
+            catalog.search(query, top_n=top_n)
+            timings.append(time.perf_counter() - start)
+
+        # Same ranking = the same scores in the same order (names with equal
+        # scores are interchangeable, as they are in the exhaustive scan)
+        same_top1 = same_topn = 0
+        checked = query_list[:check]
+        for _, query in checked:
+            fast = [round(r[0], 9) for r in catalog.search(query, top_n=top_n)]
+            full = [round(r[0], 9) for r in catalog.search(query, top_n=top_n, exhaustive=True)]
+            same_top1 += fast[:1] == full[:1]
+            same_topn += fast == full
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+    timings_ms = 1000.0 * np.array(timings)
+    return {
+        'size': size,
+        'load_s': load_s,
+        'p50_ms': float(np.percentile(timings_ms, 50)),
+        'p99_ms': float(np.percentile(timings_ms, 99)),
+        'max_ms': float(timings_ms.max()),
+        'checked': len(checked),
+        'same_top1': same_top1,
+        'same_topn': same_topn,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark song search on synthetic libraries")
+    parser.add_argument("--sizes", type=int, nargs="+", default=LIBRARY_SIZES)
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--check", type=int, default=20,
+                        help="queries to compare against an exhaustive scan (slow on big libraries)")
+    args = parser.parse_args()
+
+    print(f"{'names':>8} {'load':>8} {'p50':>9} {'p99':>9} {'max':>9}  same ranking as full scan")
+    for size in args.sizes:
+        r = bench_library(size, queries=args.queries, check=args.check)
+        ranking = (f"top-1 {r['same_top1']}/{r['checked']}, top-5 {r['same_topn']}/{r['checked']}"
+                   if r['checked'] else "not checked")
+        print(f"{r['size']:>8} {r['load_s']:>7.2f}s {r['p50_ms']:>7.2f}ms {r['p99_ms']:>7.2f}ms "
+              f"{r['max_ms']:>7.2f}ms  {ranking}")
+
+
+if __name__ == "__main__":
+    main()
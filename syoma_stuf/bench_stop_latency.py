@@ -0,0 +1,92 @@
+"""
+Control Latency Benchmark
+Runs the voice server in-process against the stub LLM server and measures
+/stop latency while idle and while a burst of /chat calls is stuck waiting
+on slow LLM answers. /stop should stay flat: it never touches the LLM pool
+"""
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import numpy as np
+
+from stub_llm_server import start_stub_server
+
+
+def _post(url, payload):
+    request = urllib.request.Request(url, data=json.dumps(payload).encode(),
+                                     headers={'Content-Type': "application/json"})
+    try:
+        with urllib.request.urlopen(request, timeout=60) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+
+def _stop_latencies(base_url, count, interval):
+    latencies = []
+    for _ in range(count):
+        start = time.perf_counter()
+        _post(f"{base_url}/stop", {})
+        latencies.append(time.perf_counter() - start)
+        time.sleep(interval)
+    return 1000.0 * np.array(latencies)
+
+
+def _summary(latencies_ms):
+    return (f"p50 {np.percentile(latencies_ms, 50):6.2f}ms  p99 {np.percentile(latencies_ms, 99):6.2f}ms  "
+            f"max {latencies_ms.max():6.2f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure /stop latency while /chat waits on a slow LLM")
+    parser.add_argument("--llm-delay", type=float, default=2.0, help="stub LLM seconds per answer")
+    parser.add_argument("--chats", type=int, default=20, help="concurrent /chat calls during the loaded run")
+    parser.add_argument("--stops", type=int, default=100, help="/stop calls per run")
+    parser.add_argument("--port", type=int, default=5055)
+    parser.add_argument("--stub-port", type=int, default=8011)
+    args = parser.parse_args()
+
+    stub = start_stub_server(args.stub_port, delay=args.llm_delay)
+    os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{args.stub_port}/v1"
+    os.environ.setdefault("OPENAI_API_KEY", "stub")
+
+    from werkzeug.serving import make_server
+    import web_server
+
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    server = make_server("127.0.0.1", args.port, web_server.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{args.port}"
+
+    idle = _stop_latencies(base_url, args.stops, 0.005)
+
+    # Utterances the local parser can't answer, all different so none hit the cache
+    statuses = []
+    chats = [threading.Thread(target=lambda i=i: statuses.append(
+                 _post(f"{base_url}/chat", {'text': f"tell me something interesting number {i}"})))
+             for i in range(args.chats)]
+    started = time.perf_counter()
+    for chat in chats:
+        chat.start()
+    time.sleep(0.1)
+    loaded = _stop_latencies(base_url, args.stops, 0.005)
+    for chat in chats:
+        chat.join()
+    chat_wall = time.perf_counter() - started
+
+    print(f"/stop idle:{'':24}{_summary(idle)}")
+    print(f"{f'/stop with {args.chats} slow /chat calls:':34}{_summary(loaded)}")
+    print(f"/chat: {args.chats} calls in {chat_wall:.1f}s (LLM {args.llm_delay:.1f}s each), statuses "
+          + ", ".join(f"{code} x{statuses.count(code)}" for code in sorted(set(statuses))))
+    server.shutdown()
+    stub.shutdown()
+
+
+if __name__ == "__main__":
+    main()
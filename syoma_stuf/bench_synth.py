@@ -0,0 +1,123 @@
+"""
+Synth Callback Benchmark
+Measures how long PolyphonicSynthesizer takes to render one audio block
+for different numbers of sounding voices
+"""
+import argparse
+import random
+import threading
+import time
+
+import numpy as np
+
+from play_midi import PolyphonicSynthesizer, SampleCache
+
+VOICE_COUNTS = [1, 8, 32, 64]
+
+
+def bench_voices(num_voices, blocksize=2048, blocks=200, sample_rate=44100, sampler=False):
+    """
+    Time generate_sample() with num_voices held notes
+
+    Returns:
+        Mean and worst render time per block in milliseconds
+    """
+    sample_cache = SampleCache(sample_rate) if sampler else None
+    synth = PolyphonicSynthesizer(sample_rate, sample_cache=sample_cache)
+    for i in range(num_voices):
+        synth.note_on(24 + i, 100)
+
+    # Warm up so the attack/decay phase is not the only thing measured
+    for _ in range(10):
+        synth.generate_sample(blocksize)
+
+    timings = []
+    for _ in range(blocks):
+        start = time.perf_counter()
+        synth.generate_sample(blocksize)
+        timings.append(time.perf_counter() - start)
+
+    return 1000.0 * sum(timings) / len(timings), 1000.0 * max(timings)
+
+
+def bench_event_handoff(seconds=3.0, voices=32, blocksize=2048, sample_rate=44100):
+    """
+    Run a fake audio callback thread in real time while a scheduler thread
+    sends note events, and time how long each note_on/note_off call blocks
+
+    Returns:
+        Dict with p50/p99/max producer call time in ms plus the synth's
+        scheduler-to-callback latency stats
+    """
+    synth = PolyphonicSynthesizer(sample_rate)
+    for i in range(voices):
+        synth.note_on(24 + i, 100)
+    block_seconds = blocksize / sample_rate
+    stop = threading.Event()
+
+    def callback_loop():
+        next_block = time.perf_counter()
+        while not stop.is_set():
+            synth.generate_sample(blocksize)
+            next_block += block_seconds
+            time.sleep(max(0.0, next_block - time.perf_counter()))
+
+    consumer = threading.Thread(target=callback_loop, daemon=True)
+    consumer.start()
+
+    call_times = []
+    rng = random.Random(0)
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        note = rng.randrange(60, 84)
+        start = time.perf_counter()
+        synth.note_on(note, 90)
+        synth.note_off(note)
+        call_times.append(time.perf_counter() - start)
+        time.sleep(rng.uniform(0.001, 0.01))
+
+    stop.set()
+    consumer.join()
+
+    call_ms = 1000.0 * np.array(call_times)
+    stats = {
+        'call_p50_ms': float(np.percentile(call_ms, 50)),
+        'call_p99_ms': float(np.percentile(call_ms, 99)),
+        'call_max_ms': float(call_ms.max()),
+    }
+    stats.update(synth.latency_stats())
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark synth render time per block")
+    parser.add_argument("--blocksize", type=int, default=2048)
+    parser.add_argument("--blocks", type=int, default=200)
+    parser.add_argument("--sample-rate", type=int, default=44100)
+    parser.add_argument("--sampler", action="store_true", help="benchmark sampler mode")
+    parser.add_argument("--events", action="store_true",
+                        help="benchmark scheduler-to-callback event handoff instead")
+    args = parser.parse_args()
+
+    if args.events:
+        stats = bench_event_handoff(blocksize=args.blocksize, sample_rate=args.sample_rate)
+        print(f"📨 Event handoff with a real-time callback at block size {args.blocksize}")
+        print(f"  note_on/note_off call (lock wait): p50 {stats['call_p50_ms']:.3f} ms, "
+              f"p99 {stats['call_p99_ms']:.3f} ms, max {stats['call_max_ms']:.3f} ms")
+        print(f"  scheduler -> callback latency:     p50 {stats['p50_ms']:.1f} ms, "
+              f"p99 {stats['p99_ms']:.1f} ms, max {stats['max_ms']:.1f} ms")
+        return
+
+    budget_ms = 1000.0 * args.blocksize / args.sample_rate
+    print(f"🎹 Block size {args.blocksize} @ {args.sample_rate} Hz "
+          f"(budget {budget_ms:.2f} ms per block)"
+          + (" [sampler mode]" if args.sampler else ""))
+    print(f"{'voices':>8} {'mean ms':>10} {'max ms':>10} {'% budget':>10}")
+    for voices in VOICE_COUNTS:
+        mean_ms, max_ms = bench_voices(voices, args.blocksize, args.blocks,
+                                       args.sample_rate, args.sampler)
+        print(f"{voices:>8} {mean_ms:>10.3f} {max_ms:>10.3f} {100.0 * mean_ms / budget_ms:>9.1f}%")
+
+
+if __name__ == "__main__":
+    main()
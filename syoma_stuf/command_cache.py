@@ -0,0 +1,98 @@
+"""
+Voice Command Cache
+Remembers what the LLM answered for each utterance, so repeated phrases
+("go back", "slower", "play ode to joy") skip the round trip. Keys are
+normalized utterances; entries expire after a TTL and the least recently
+used ones are evicted past max_entries. With a path, the cache is loaded at
+startup and written back (atomically) whenever it changes
+"""
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+import metrics
+from voice_commands import normalize_utterance
+
+
+class CommandCache:
+    """Bounded LRU + TTL map from utterance to LLM command"""
+
+    def __init__(self, max_entries=1024, ttl=24 * 3600, path=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.path = Path(path) if path else None
+        self.stats = {'hits': 0, 'misses': 0, 'expired': 0, 'evictions': 0}
+        self._entries = OrderedDict()  # normalized utterance -> (command, time stored)
+        self._lock = threading.Lock()
+        if self.path:
+            self._load()
+
+    def get(self, utterance):
+        """The cached command for utterance, or None"""
+        key = normalize_utterance(utterance)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.time() - entry[1] > self.ttl:
+                del self._entries[key]
+                self.stats['expired'] += 1
+                entry = None
+            if entry is None:
+                self.stats['misses'] += 1
+                metrics.cache_misses.inc(cache='llm_command')
+                return None
+            self._entries.move_to_end(key)
+            self.stats['hits'] += 1
+            metrics.cache_hits.inc(cache='llm_command')
+            return entry[0]
+
+    def put(self, utterance, command):
+        key = normalize_utterance(utterance)
+        with self._lock:
+            self._entries[key] = (command, time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats['evictions'] += 1
+            if self.path:
+                self._save()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            if self.path:
+                self._save()
+
+    def cache_stats(self):
+        """Hit/miss/eviction counters, hit rate and current size"""
+        with self._lock:
+            lookups = self.stats['hits'] + self.stats['misses']
+            return {**self.stats, 'size': len(self._entries), 'max_entries': self.max_entries,
+                    'hit_rate': self.stats['hits'] / lookups if lookups else 0.0}
+
+    def _load(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                entries = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            print(f"[Command cache] Ignoring unreadable {self.path}: {e}")
+            return
+        now = time.time()
+        # Saved oldest first, so LRU order survives the restart
+        for key, command, stored in entries[-self.max_entries:]:
+            if now - stored <= self.ttl:
+                self._entries[key] = (command, stored)
+
+    def _save(self):
+        """Write the entries (caller holds _lock); a failed write only costs the persistence"""
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump([[key, command, stored] for key, (command, stored) in self._entries.items()], f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"[Command cache] Could not save {self.path}: {e}")
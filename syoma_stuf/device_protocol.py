@@ -0,0 +1,178 @@
+"""
+Arduino Wire Protocol
+Encodes note events for midi_led_stream.ino and negotiates which format the
+connected sketch understands
+
+ASCII (always supported), one line per note:
+    E,<note>,<duration ms>\n
+
+Binary, 6 bytes per note, fired on arrival:
+    [0xA5, note, duration ms (uint16 LE), velocity, checksum]
+
+Timed binary, 10 bytes per note, queued on the device and fired on its own
+millis() clock at <at ms> after the last "S" (start clock) command:
+    [0xA6, note, duration ms (uint16 LE), velocity, at ms (uint32 LE), checksum]
+
+Checksums are the XOR of every byte between the sync byte and the checksum.
+
+Control lines (host -> device):
+    P,B   request binary frames         -> OK,B
+    P,T   request timed frames          -> OK,T,<queue slots>
+    S     start the device clock
+    X     clear the queue, all LEDs off -> R,<queue slots>
+Credit lines (device -> host):
+    C,<n> n queue slots were freed (their notes fired)
+"""
+import struct
+import time
+
+import serial
+
+FRAME_SYNC = 0xA5
+TIMED_FRAME_SYNC = 0xA6
+
+
+def negotiate(ser, timeout=0.5):
+    """
+    Find out which formats the sketch on ser speaks. Sketches that only know
+    ASCII ignore the requests, so silence means ASCII.
+
+    Returns:
+        Dict with 'protocol' ('binary' or 'ascii') and 'queue_slots'
+        (device queue size for timed frames, 0 if unsupported)
+    """
+    result = {'protocol': 'ascii', 'queue_slots': 0}
+    try:
+        ser.reset_input_buffer()
+        if _request(ser, b"P,B\n", timeout) == [b"OK", b"B"]:
+            result['protocol'] = 'binary'
+            reply = _request(ser, b"P,T\n", timeout)
+            if reply and reply[:2] == [b"OK", b"T"] and len(reply) == 3:
+                result['queue_slots'] = int(reply[2])
+    except (AttributeError, ValueError, serial.SerialException, OSError):
+        pass
+    if result['queue_slots']:
+        print(f"🔌 Device speaks timed binary frames ({result['queue_slots']} queue slots)")
+    else:
+        print(f"🔌 Device speaks the {result['protocol']} protocol")
+    return result
+
+
+def _request(ser, line, timeout):
+    """Send a control line and return the comma-split reply, or None on silence"""
+    ser.write(line)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        reply = ser.readline().strip()
+        if reply.startswith(b"OK"):
+            return reply.split(b",")
+    return None
+
+
+def _checksum(body):
+    checksum = 0
+    for byte in body:
+        checksum ^= byte
+    return checksum
+
+
+def encode_event(note, dur_ms, velocity, binary):
+    """Wire bytes for one note; every note is folded onto the octave from C4 (60) to B4 (71)"""
+    mapped_note = 60 + note % 12
+    if binary:
+        body = struct.pack('<BHB', mapped_note, min(max(dur_ms, 0), 0xFFFF), velocity)
+        return bytes([FRAME_SYNC]) + body + bytes([_checksum(body)])
+    return f"E,{mapped_note},{dur_ms}\n".encode('ascii')
+
+
+def encode_timed_event(note, dur_ms, velocity, at_ms):
+    """Timed frame: fire note at at_ms on the device clock"""
+    body = struct.pack('<BHBI', 60 + note % 12, min(max(dur_ms, 0), 0xFFFF), velocity,
+                       max(at_ms, 0))
+    return bytes([TIMED_FRAME_SYNC]) + body + bytes([_checksum(body)])
+
+
+class TimedStream:
+    """
+    Host side of the timed protocol: tracks how many queue slots the device
+    has free (credits) and only sends as many frames as it can hold.
+
+    The handle is fetched through connect() on every poll, so a port the
+    pool reopened is picked up; the device rebooted with it (empty queue,
+    clock stopped), which poll() reports through self.reconnected
+    """
+
+    def __init__(self, write, connect, slots):
+        self.write = write  # write(bytes), e.g. a bound SerialPool.write
+        self.connect = connect  # connect() -> current handle, e.g. a bound SerialPool.get
+        self.ser = connect()
+        self.slots = slots
+        self.credits = 0
+        self.reconnected = False  # set by poll() when the handle changed; the caller clears it
+        self._awaiting_reset = False
+        self._rx = bytearray()
+
+    def reset(self, wait, timeout=0.5):
+        """
+        Clear the device queue and wait for it to hand back every slot
+
+        Args:
+            wait: Sleep function used while polling, e.g. an Event's wait()
+
+        Returns:
+            True once the device confirmed the reset
+        """
+        self.clear()
+        deadline = time.monotonic() + timeout
+        while self._awaiting_reset and time.monotonic() < deadline:
+            if wait(0.005):
+                break
+            self.poll()
+        return not self._awaiting_reset
+
+    def clear(self):
+        """Drop everything queued on the device and switch its LEDs off"""
+        self.credits = 0
+        self._awaiting_reset = True
+        self.write(b"X\n")
+
+    def start_clock(self):
+        """Make the device's at_ms = 0 now"""
+        self.write(b"S\n")
+
+    def poll(self):
+        """
+        Read any credit/reset lines the device has sent
+
+        Raises:
+            serial.SerialException / OSError if the port cannot be reopened
+        """
+        ser = self.connect()
+        if ser is not self.ser:
+            self.ser = ser
+            self.credits = 0
+            self._rx.clear()
+            self.reconnected = True
+        try:
+            waiting = ser.in_waiting
+            if not waiting:
+                return
+            self._rx += ser.read(waiting)
+        except (serial.SerialException, OSError):
+            return  # dropped since connect(); the next poll reopens it
+        *lines, rest = self._rx.split(b"\n")
+        self._rx = bytearray(rest)
+        for line in lines:
+            parts = line.strip().split(b",")
+            if len(parts) != 2 or not parts[1].isdigit():
+                continue
+            if parts[0] == b"R":
+                self.credits = int(parts[1])
+                self._awaiting_reset = False
+            elif parts[0] == b"C" and not self._awaiting_reset:
+                self.credits = min(self.slots, self.credits + int(parts[1]))
+
+    def send(self, frames):
+        """Send queued frames; the caller must not exceed self.credits"""
+        self.write(b"".join(frames))
+        self.credits -= len(frames)
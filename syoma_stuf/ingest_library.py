@@ -0,0 +1,183 @@
+"""
+Bulk MIDI Library Ingest
+Parses every new or changed MIDI file in a folder across a process pool, in
+one pass per file: validates it, compiles its timeline into the on-disk
+timeline cache and extracts the metadata stored in the song library index.
+
+Files that fail are moved into a quarantine folder (with the reason appended
+to quarantine.log) so they never reach playback; progress and throughput are
+printed as the pool works through the folder
+"""
+import argparse
+import math
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+from midi_timeline import drop_cached_timeline, load_timeline
+from song_library import DB_NAME, DB_PATH_ENV, SongLibrary, extract_metadata
+from song_search import MIDI_FOLDER
+
+QUARANTINE_DIR_NAME = "quarantine"
+STORE_BATCH = 500  # results written to the library per transaction
+MAX_UNRELEASED = 0.1  # share of note-ons that may never be released (those notes are dropped)
+
+
+def validate(mid, timeline, note_count):
+    """
+    Reasons a parsed file would not play properly
+
+    Args:
+        note_count: Note-ons in the file (extract_metadata's note_count)
+
+    Returns:
+        List of problems (empty when the file is fine)
+    """
+    problems = []
+    if mid.type == 2:
+        problems.append("type 2 (asynchronous tracks) is not supported")
+        return problems
+    if not len(timeline):
+        problems.append("no playable notes")
+    elif note_count - len(timeline) > MAX_UNRELEASED * note_count:
+        problems.append(f"{note_count - len(timeline)} of {note_count} notes are never released")
+    length = mid.length
+    if not math.isfinite(length) or length <= 0:
+        problems.append(f"bad length {length}")
+    return problems
+
+
+def _ingest_one(midi_file):
+    """Process pool worker: parse, validate and cache one file, returning its metadata or the error"""
+    import mido
+
+    started = time.perf_counter()
+    try:
+        mid = mido.MidiFile(midi_file)
+        timeline = load_timeline(midi_file, mid=mid)
+        metadata = extract_metadata(midi_file, mid=mid)
+        problems = validate(mid, timeline, metadata['note_count'])
+        if problems:
+            return {'file': midi_file, 'error': "; ".join(problems)}
+    except Exception as e:
+        return {'file': midi_file, 'error': f"{type(e).__name__}: {e}"}
+    return {'file': midi_file, 'metadata': metadata, 'parse_s': time.perf_counter() - started}
+
+
+def quarantine(midi_file, reason, quarantine_folder):
+    """Move a failed file out of the library folder, with the timeline cached for it, and log why"""
+    midi_file = Path(midi_file)
+    quarantine_folder.mkdir(exist_ok=True)
+    try:
+        shutil.move(str(midi_file), str(quarantine_folder / midi_file.name))
+    except OSError as e:
+        print(f"  ⚠️ Could not quarantine {midi_file.name}: {e}")
+        return False
+    drop_cached_timeline(midi_file)
+    with open(quarantine_folder / "quarantine.log", "a", encoding="utf-8") as log:
+        log.write(f"{time.strftime('%Y-%m-%d %H:%M:%S')}\t{midi_file.name}\t{reason}\n")
+    return True
+
+
+def ingest_library(midi_folder, workers=None, force=False, move_failed=True, progress_every=1.0,
+                   db_path=None):
+    """
+    Ingest every new or changed .mid file in midi_folder
+
+    Args:
+        force: Re-parse every file, not only those changed since the last ingest
+        move_failed: Quarantine files that fail (otherwise just report them)
+        progress_every: Seconds between progress lines
+        db_path: Library database file (default: in midi_folder)
+
+    Returns:
+        Dict with counts of files ingested, failed, quarantined and removed,
+        plus the wall time and files/s
+    """
+    library = SongLibrary(midi_folder, db_path)
+    scanned = library.scan()
+    if scanned is None:
+        return None
+    changed, removed = scanned
+    if force:
+        with os.scandir(library.folder) as entries:
+            changed = {entry.name: entry.stat() for entry in entries
+                       if entry.name.endswith('.mid') and entry.is_file()}
+    library.remove(removed)
+
+    quarantine_folder = library.folder / QUARANTINE_DIR_NAME
+    workers = workers or os.cpu_count()
+    total = len(changed)
+    total_mb = sum(stat.st_size for stat in changed.values()) / 1e6
+    print(f"🎹 Ingesting {total} files ({total_mb:.1f} MB) from {library.folder} with {workers} workers "
+          f"({library.count()} already indexed, {len(removed)} removed)")
+
+    done = ingested = failed = quarantined = 0
+    pending = []
+    started = last_report = time.perf_counter()
+    if total:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(_ingest_one, str(library.folder / filename)) for filename in changed]
+            for future in as_completed(futures):
+                result = future.result()
+                filename = Path(result['file']).name
+                done += 1
+                if 'error' in result:
+                    failed += 1
+                    print(f"  ❌ {filename}: {result['error']}")
+                    if move_failed and quarantine(result['file'], result['error'], quarantine_folder):
+                        library.remove([filename])
+                        quarantined += 1
+                    else:
+                        # Still in the folder: keep it from looking changed on every scan
+                        library.mark_failed([(filename, changed[filename], result['error'])])
+                else:
+                    ingested += 1
+                    pending.append((filename, changed[filename], result['metadata']))
+                    if len(pending) >= STORE_BATCH:
+                        library.store(pending)
+                        pending = []
+
+                now = time.perf_counter()
+                if now - last_report >= progress_every or done == total:
+                    last_report = now
+                    elapsed = now - started
+                    print(f"  [{done}/{total}] {done / elapsed:.0f} files/s, "
+                          f"{ingested} ok, {failed} failed")
+        library.store(pending)
+
+    wall = time.perf_counter() - started
+    summary = {
+        'ingested': ingested,
+        'failed': failed,
+        'quarantined': quarantined,
+        'removed': len(removed),
+        'indexed': library.count(),
+        'wall_s': wall,
+        'files_per_s': done / wall if wall > 0 else 0.0,
+    }
+    library.close()
+    print(f"✅ {ingested} ingested, {failed} failed ({quarantined} quarantined in {quarantine_folder}), "
+          f"{summary['indexed']} songs indexed, {wall:.2f}s ({summary['files_per_s']:.0f} files/s)")
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Validate and index a folder of MIDI files in parallel")
+    parser.add_argument("midi_folder", nargs="?", default=MIDI_FOLDER)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--force", action="store_true", help="re-parse files that are already indexed")
+    parser.add_argument("--no-quarantine", action="store_true",
+                        help="report failed files without moving them")
+    parser.add_argument("--db", default=os.getenv(DB_PATH_ENV),
+                        help=f"library database file (default: {DB_NAME} in the folder)")
+    args = parser.parse_args()
+
+    ingest_library(args.midi_folder, workers=args.workers, force=args.force,
+                   move_failed=not args.no_quarantine, db_path=args.db)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""
+Metrics
+Process-wide counters and latency histograms for the command path, rendered
+in the Prometheus text format by web_server's /metrics. Observing a value is
+a bisect and a few additions under the metric's own lock (about a
+microsecond), so the instrumentation stays on in production
+"""
+import bisect
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+# Seconds; request and I/O latencies from sub-millisecond to a slow LLM call
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Seconds after the deadline; negative when a timed frame reached the device early
+LATENESS_BUCKETS = (-0.1, -0.05, -0.01, -0.001, 0.0, 0.0005, 0.001, 0.002, 0.005,
+                    0.01, 0.025, 0.05, 0.1)
+
+_registry = []
+
+
+class Counter:
+    """Monotonic count, optionally split by the values of labelnames"""
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}  # label values -> count
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            return self._values.get(key, 0)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = sorted(self._values.items())
+        if not values and not self.labelnames:
+            values = [((), 0)]
+        for key, count in values:
+            lines.append(f"{self.name}{_labels(zip(self.labelnames, key))} {_number(count)}")
+        return lines
+
+
+class Histogram:
+    """Bucketed distribution of observed values (cumulative buckets, sum and count)"""
+
+    def __init__(self, name, help, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * (len(self.buckets) + 1)  # last slot: above every bound
+        self._sum = 0.0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+            self._count += 1
+
+    @contextmanager
+    def time(self):
+        """Observe how long the with-block took"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    def render(self):
+        with self._lock:
+            counts = list(self._counts)
+            total, count = self._sum, self._count
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets, counts):
+            cumulative += bucket_count
+            lines.append(f'{self.name}_bucket{{le="{_number(bound)}"}} {cumulative}')
+        lines.append(f'{self.name}_bucket{{le="+Inf"}} {count}')
+        lines.append(f"{self.name}_sum {_number(total)}")
+        lines.append(f"{self.name}_count {count}")
+        return lines
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(pairs):
+    escaped = [f'{name}="{_escape(value)}"' for name, value in pairs]
+    return "{" + ",".join(escaped) + "}" if escaped else ""
+
+
+def _number(value):
+    if isinstance(value, float) and math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def counter(name, help, labelnames=()):
+    metric = Counter(name, help, labelnames)
+    _registry.append(metric)
+    return metric
+
+
+def histogram(name, help, buckets=LATENCY_BUCKETS):
+    metric = Histogram(name, help, buckets)
+    _registry.append(metric)
+    return metric
+
+
+def render():
+    """Every registered metric in the Prometheus text exposition format"""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# Command path
+chat_seconds = histogram("piano_chat_request_seconds", "Total /chat request latency")
+llm_seconds = histogram("piano_llm_call_seconds", "OpenAI chat completion call latency")
+voice_commands = counter("piano_voice_commands_total", "Voice commands by who parsed them",
+                         ["parser"])
+song_search_seconds = histogram("piano_song_search_seconds", "search_song latency")
+
+# Playback
+midi_parse_seconds = histogram("piano_midi_parse_seconds", "Time to parse and compile a MIDI timeline")
+scheduler_lateness_seconds = histogram("piano_scheduler_lateness_seconds",
+                                       "How late each event fired after its deadline",
+                                       LATENESS_BUCKETS)
+serial_write_seconds = histogram("piano_serial_write_seconds", "Duration of each serial write")
+dropped_notes = counter("piano_dropped_notes_total", "Notes lost to write errors or cut off by voice stealing",
+                        ["reason"])
+
+# Local synth
+audio_render_seconds = histogram("piano_audio_render_seconds", "Audio callback render time per block")
+audio_underruns = counter("piano_audio_underruns_total", "Audio output underflows reported by the device")
+
+# Caches
+cache_hits = counter("piano_cache_hits_total", "Cache hits", ["cache"])
+cache_misses = counter("piano_cache_misses_total", "Cache misses", ["cache"])
@@ -1,131 +1,521 @@
+import atexit
+import bisect
 import threading
-import time
-import mido
+import numpy as np
 import serial
 from pathlib import Path
 
-# Global thread control
-_current_thread = None
-_stop_flag = False
+import device_protocol
+import metrics
+from device_protocol import TimedStream, encode_event, encode_timed_event
+from midi_timeline import load_timeline
+from playback_scheduler import PlaybackScheduler
+from serial_pool import SerialPool
+
+# The current playback session
+_current_session = None
 _lock = threading.Lock()
 
-def _play_midi_worker(midi_file, start_time, playback_speed, port, baud):
-    global _stop_flag
+# Serial ports stay open across playbacks; opening one resets the Arduino,
+# and each new connection negotiates the wire format once
+_serial_pool = SerialPool(handshake=device_protocol.negotiate)
+atexit.register(_serial_pool.close_all)
+
+# Timed streaming: notes are sent up to TIMED_LOOKAHEAD seconds early and the
+# device clock starts TIMED_LEAD seconds behind ours so the first notes arrive in time
+TIMED_LOOKAHEAD = 0.5
+TIMED_LEAD = 0.05
+TIMED_CREDIT_WAIT = 0.005  # seconds between credit checks while the device queue is full
+TIMED_CREDIT_TIMEOUT = 0.25  # seconds past the last fire time before missing credits count as lost
+
+def _coalesce_chords(events, tolerance, binary=False, rate=1.0):
+    """
+    Group events whose onsets fall within tolerance seconds (of playback time)
+    of the group's first event, so a chord costs one wake-up and one serial write
+
+    Args:
+        events: (song position s, note, duration s, velocity) tuples
+        rate: Playback rate the durations and tolerance are scaled for
+
+    Returns:
+        List of (group position, [event positions], payload bytes)
+    """
+    groups = []
+    tolerance *= rate  # playback seconds -> song seconds
+    for position, note, duration, velocity in events:
+        line = encode_event(note, int(round(duration / rate * 1000.0)), velocity, binary)
+        if groups and position - groups[-1][0] <= tolerance:
+            groups[-1][1].append(position)
+            groups[-1][2].append(line)
+        else:
+            groups.append((position, [position], [line]))
+    return [(group_position, positions, b"".join(lines)) for group_position, positions, lines in groups]
+
+def stream_throughput(groups, baud, window=0.25, rate=1.0):
+    """
+    Compare the densest stretch of a prepared stream against the serial link
+
+    Args:
+        groups: Output of _coalesce_chords
+        baud: Link speed; 8N1 framing sends 10 bits per byte
+        window: Length in seconds of the sliding window used for the peak
+        rate: Playback rate, to turn song positions into playback time
+
+    Returns:
+        Dict with peak events/s and bytes/s, link capacity in bytes/s and
+        the headroom factor (capacity / peak)
+    """
+    link_bytes_per_s = baud / 10.0
+    if not groups:
+        return {'window_ms': 1000.0 * window, 'peak_events_per_s': 0.0, 'peak_bytes_per_s': 0.0,
+                'link_bytes_per_s': link_bytes_per_s, 'headroom': float('inf')}
+    times = np.array([g[0] for g in groups]) / rate
+    events = np.cumsum([0] + [len(g[1]) for g in groups])
+    sizes = np.cumsum([0] + [len(g[2]) for g in groups])
+    # For each group, everything sent from it until window seconds later
+    ends = np.searchsorted(times, times + window, side='left')
+    starts = np.arange(len(groups))
+    peak_events = (events[ends] - events[starts]).max() / window
+    peak_bytes = (sizes[ends] - sizes[starts]).max() / window
+    return {
+        'window_ms': 1000.0 * window,
+        'peak_events_per_s': float(peak_events),
+        'peak_bytes_per_s': float(peak_bytes),
+        'link_bytes_per_s': link_bytes_per_s,
+        'headroom': float(link_bytes_per_s / peak_bytes) if peak_bytes else float('inf'),
+    }
+
+def _stream_immediate(events, start_time, port, baud, scheduler, chord_tolerance, binary):
+    """
+    Write each chord group the moment it is due. When the rate changes the
+    remaining events are regrouped and their durations re-encoded, so the
+    new tempo applies from the next write.
 
-    try:
-        midi_file = Path(midi_file).expanduser().resolve()
-        print(f"🎵 Opening MIDI file: {midi_file}")
-        mid = mido.MidiFile(midi_file)
+    Returns:
+        (groups sent, events sent, bytes sent)
+    """
+    sent_groups = []
+    sent = 0
+    bytes_sent = 0
+    rate = None
+    scheduler.start(start_time)
+    while sent < len(events):
+        if scheduler.rate != rate:
+            rate = scheduler.rate
+            groups = iter(_coalesce_chords(events[sent:], chord_tolerance, binary, rate))
+        position, positions, payload = next(groups)
+        if not scheduler.wait_for(position):
+            print("🛑 Playback stopped by new command.")
+            break
+        if scheduler.rate != rate:
+            rate = None  # retimed while waiting: re-encode from this group
+            continue
 
-        print(f"Opening serial port {port} @ {baud}")
         try:
-            ser = serial.Serial(port, baud, timeout=0.1)
+            _serial_pool.write(port, baud, payload)
         except Exception as e:
-            print(f"[Serial error] Could not open port {port}: {e}")
-            return
-        time.sleep(2.0)
-
-        events = []
-        pending_notes = {}
-
-        time_acc = 0.0
-        for msg in mid:
-            time_acc += msg.time
-            if msg.type == 'note_on' and msg.velocity > 0:
-                pending_notes.setdefault(msg.note, []).append(time_acc)
-            elif msg.type in ('note_off',) or (msg.type == 'note_on' and msg.velocity == 0):
-                if msg.note in pending_notes and pending_notes[msg.note]:
-                    start = pending_notes[msg.note].pop(0)
-                    duration_s = time_acc - start
-                    events.append((start, msg.note, int(round((duration_s / playback_speed) * 1000.0))))
-
-        events.sort(key=lambda e: e[0])
-        events = [((ev_time - start_time) / playback_speed, note, dur_ms)
-                  for ev_time, note, dur_ms in events if ev_time >= start_time]
+            print(f"[Serial write error] {e}")
+            metrics.dropped_notes.inc(len(positions), reason='serial_error')
+        for event_position in positions:
+            scheduler.record(event_position)
+        sent_groups.append((position, positions, payload))
+        sent += len(positions)
+        bytes_sent += len(payload)
+    return sent_groups, sent, bytes_sent
 
-        if not events:
-            print("No events to play from the specified start time.")
-            ser.close()
-            return
+def _stream_timed(events, start_time, port, baud, scheduler, slots):
+    """
+    Send events ahead of time with device timestamps; the sketch queues them
+    and fires each on its own millis() clock, so host hiccups shorter than the
+    lookahead never reach the LEDs. The device hands out one credit per free
+    queue slot and we never send more frames than it has credits for.
 
-        print(f"Prepared {len(events)} events. Starting in 2 seconds...")
-        time.sleep(2.0)
+    Timestamps are computed as frames are sent, so a rate change applies to
+    everything not yet queued on the device (at most TIMED_LOOKAHEAD ahead).
+    Pausing clears the device queue; unfired notes are resent on resume.
+    Lateness is recorded against each note's fire time, so it is negative
+    by however far ahead the note reached the device.
 
-        real_start = time.time()
+    If the port drops and the pool reopens it, the device has rebooted: its
+    queue is reset and its clock restarted, and the unfired notes are resent
+    against the new clock. Playback ends if the port stays gone or the device
+    no longer speaks the timed protocol. Credits that never come back (frames
+    mangled on the wire) are recovered the same way, without the clock restart.
 
-        note_names = ['C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B']
-        letter_to_note = {
-            'C': 60, 'C#': 61, 'D': 62, 'D#': 63, 'E': 64,
-            'F': 65, 'F#': 66, 'G': 67, 'G#': 68, 'A': 69, 'A#': 70, 'B': 71
-        }
+    Returns:
+        (groups sent, events sent, bytes sent)
+    """
+    stream = TimedStream(lambda data: _serial_pool.write(port, baud, data),
+                         lambda: _serial_pool.get(port, baud, wait=scheduler.sleep), slots)
+    if not stream.reset(scheduler.sleep):
+        print("[Timed stream] Device did not confirm the queue reset.")
+        return [], 0, 0
 
-        sent = 0
-        for ev_time, note, dur_ms in events:
-            if _stop_flag:
-                print("🛑 Playback stopped by new command.")
+    positions = [event[0] for event in events]
+    sent_groups = []
+    sent = 0
+    bytes_sent = 0
+    last_fire_ms = 0
+    clock_origin = 0.0  # now() when the device clock last started
+    held = False
+    stream.start_clock()
+    scheduler.start(start_time)
+    while True:
+        if scheduler.stopped:
+            break
+        if scheduler.paused:
+            if not held:
+                # Drop what the device has queued (and its LEDs) and resend
+                # whatever had not fired yet once playback resumes. The device
+                # plays TIMED_LEAD behind us, so that is where it stopped.
+                stream.clear()
+                played_to = scheduler.position() - TIMED_LEAD * scheduler.rate
+                sent = min(sent, bisect.bisect_right(positions, played_to))
+                held = True
+        else:
+            held = False
+        if sent < len(events):
+            target = scheduler.deadline_for(events[sent][0]) + TIMED_LEAD - TIMED_LOOKAHEAD
+        else:
+            # Stay alive until the device has played everything, so stop still works
+            target = scheduler.deadline_for(events[-1][0]) + TIMED_LEAD
+        if not scheduler.wait_until(target):
+            scheduler.wake_event.clear()  # paused, resumed or retimed: re-plan
+            continue
+        if sent == len(events):
+            break
+        try:
+            stream.poll()
+        except (serial.SerialException, OSError) as e:
+            print(f"[Timed stream] Lost {port}: {e}")
+            break
+        if stream.reconnected:
+            stream.reconnected = False
+            stream.slots = (_serial_pool.handshakes.get((port, baud)) or {}).get('queue_slots', 0)
+            if scheduler.stopped:
                 break
+            if not stream.slots or not stream.reset(scheduler.sleep):
+                print("[Timed stream] Device came back without the timed queue, ending playback.")
+                break
+            stream.start_clock()
+            clock_origin = scheduler.now()
+            last_fire_ms = 0
+            played_to = scheduler.position() - TIMED_LEAD * scheduler.rate
+            sent = min(sent, bisect.bisect_right(positions, played_to))
+            continue
+        overdue = scheduler.now() - clock_origin - last_fire_ms / 1000.0
+        if stream.credits <= 0 and overdue > TIMED_CREDIT_TIMEOUT:
+            # Everything queued should have fired and handed its slot back by now
+            print("[Timed stream] Device stopped returning credits, resetting its queue.")
+            if not stream.reset(scheduler.sleep):
+                print("[Timed stream] Device did not confirm the queue reset.")
+                break
+            played_to = scheduler.position() - TIMED_LEAD * scheduler.rate
+            sent = min(sent, bisect.bisect_right(positions, played_to))
+            continue
+        if stream.credits <= 0:
+            # Block for a real interval (scheduler.sleep spins this close to
+            # its deadline); pause, stop or a rate change still wake us at once
+            scheduler.wake_event.wait(TIMED_CREDIT_WAIT)
+            continue
 
-            # Timing control
-            while not _stop_flag:
-                now = time.time() - real_start
-                to_sleep = ev_time - now
-                if to_sleep <= 0:
-                    break
-                time.sleep(0.01 if to_sleep > 0.02 else to_sleep)
-
-            if _stop_flag:
-                print("🛑 Playback interrupted mid-event.")
+        horizon = scheduler.now() + TIMED_LOOKAHEAD
+        rate = scheduler.rate
+        batch = []
+        while sent + len(batch) < len(events) and len(batch) < stream.credits:
+            position, note, duration, velocity = events[sent + len(batch)]
+            fire_time = scheduler.deadline_for(position) + TIMED_LEAD
+            if fire_time > horizon:
                 break
+            # Never fire before a note queued at the old rate
+            last_fire_ms = max(last_fire_ms, int(round((fire_time - clock_origin) * 1000.0)))
+            batch.append((position, encode_timed_event(note, int(round(duration / rate * 1000.0)),
+                                                       velocity, last_fire_ms)))
+        if not batch:
+            continue
+        try:
+            stream.send([frame for _, frame in batch])
+        except Exception as e:
+            print(f"[Serial write error] {e}")
+            metrics.dropped_notes.inc(len(batch), reason='serial_error')
+        for position, frame in batch:
+            scheduler.record(position, TIMED_LEAD)
+            sent_groups.append((position, [position], frame))
+            bytes_sent += len(frame)
+        sent += len(batch)
+
+    if scheduler.stopped:
+        print("🛑 Playback stopped by new command.")
+        stream.clear()
+    return sent_groups, sent, bytes_sent
+
+class PlaybackSession:
+    """
+    One playback of one MIDI file: its worker thread, scheduler and song
+    position. position() and status() are O(1) and safe to poll from any
+    thread; pause() and resume() hold the worker at its current event
+    without re-reading the file or reopening the port
+    """
+
+    def __init__(self, midi_file, start_time=0.0, playback_speed=1.0, port="COM3", baud=115200,
+                 chord_tolerance=0.005, protocol="auto", paused=False):
+        self.midi_file = midi_file
+        self.start_time = start_time
+        self.port = port
+        self.baud = baud
+        self.chord_tolerance = chord_tolerance
+        self.protocol = protocol
+        self.length = None  # song length in seconds, known once the timeline is loaded
+        self.completed = False  # played through to the end
+        self.previous = None  # stopped session whose worker must exit before ours opens the port
+        self.scheduler = PlaybackScheduler(rate=playback_speed, position=start_time)
+        if paused:
+            self.scheduler.pause()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def is_alive(self):
+        return self.thread.is_alive()
 
-            pitch_class = note % 12
-            note_letter = note_names[pitch_class]
-            mapped_note = letter_to_note[note_letter]
-            line = f"E,{mapped_note},{dur_ms}\n"
+    def position(self):
+        """Song position in seconds"""
+        if self.completed:
+            return self.length
+        position = self.scheduler.position()
+        return position if self.length is None else min(position, self.length)
 
-            print(f"Mapping {note} ({note_letter}) → {mapped_note} | "
-                  f"event_t={ev_time:.3f}s real_t={time.time() - real_start:.3f}s dur={dur_ms}ms")
-            try:
-                ser.write(line.encode('ascii'))
-            except Exception as e:
-                print(f"[Serial write error] {e}")
-            sent += 1
+    def state(self):
+        """'playing', 'paused', 'stopped' or 'finished'"""
+        if self.completed:
+            return 'finished'
+        if self.scheduler.stopped or not self.thread.is_alive():
+            return 'stopped'
+        return 'paused' if self.scheduler.paused else 'playing'
 
-        print("✅ Playback complete or interrupted.")
+    def status(self):
+        """Snapshot for UIs: file, state, position, length, progress (0-1) and speed"""
+        position = self.position()
+        return {
+            'file': str(self.midi_file),
+            'state': self.state(),
+            'position': position,
+            'length': self.length,
+            'progress': position / self.length if self.length else 0.0,
+            'speed': self.scheduler.rate,
+        }
+
+    def pause(self):
+        self.scheduler.pause()
+
+    def resume(self):
+        self.scheduler.resume()
+
+    def set_speed(self, playback_speed):
+        if playback_speed <= 0:
+            raise ValueError(f"playback_speed must be positive, got {playback_speed}")
+        self.scheduler.set_rate(playback_speed)
+
+    def stop(self, timeout=0.0):
+        """Stop playback, waiting up to timeout seconds for the worker to exit (0: don't wait)"""
+        self.scheduler.wake()
+        if timeout > 0 and self.thread.is_alive() and self.thread is not threading.current_thread():
+            self.thread.join(timeout=timeout)
+
+    def _run(self):
+        try:
+            # The old worker may still be writing its last frames or clearing
+            # the device queue; wait for it here rather than in the caller
+            if self.previous is not None:
+                self.previous.thread.join(timeout=1.0)
+                self.previous = None
+            self._play()
+        except Exception as e:
+            import traceback
+            print(f"[MIDI worker error] {e}")
+            traceback.print_exc()
+
+    def _play(self):
+        """Load the timeline, open the port and stream until done or stopped"""
+        midi_file = Path(self.midi_file).expanduser().resolve()
+        print(f"🎵 Loading MIDI timeline: {midi_file}")
+        timeline = load_timeline(midi_file)
+        self.length = timeline.length
+
+        try:
+            ser = _serial_pool.get(self.port, self.baud, wait=self.scheduler.sleep)
+        except Exception as e:
+            print(f"[Serial error] Could not open port {self.port}: {e}")
+            return
+
+        # Events stay in song time; the scheduler turns positions into deadlines
+        mask = timeline.onset >= self.start_time
+        events = list(zip(timeline.onset[mask].tolist(),
+                          timeline.note[mask].tolist(),
+                          timeline.duration[mask].tolist(),
+                          timeline.velocity[mask].tolist()))
+
+        if not events:
+            print("No events to play from the specified start time.")
+            self.completed = True
+            return
+
+        handshake = _serial_pool.handshakes.get((self.port, self.baud)) or {}
+        if self.protocol in ('auto', 'timed') and handshake.get('queue_slots'):
+            mode = 'timed'
+        elif self.protocol in ('auto', 'timed', 'binary') and handshake.get('protocol') == 'binary':
+            mode = 'binary'
+        else:
+            mode = 'ascii'
+
+        if mode == 'timed':
+            print(f"Prepared {len(events)} events, streaming {TIMED_LOOKAHEAD:.1f}s ahead.")
+            groups, sent, bytes_sent = _stream_timed(events, self.start_time, self.port, self.baud,
+                                                     self.scheduler, handshake['queue_slots'])
+        else:
+            print(f"Prepared {len(events)} events as {mode} writes.")
+            groups, sent, bytes_sent = _stream_immediate(events, self.start_time, self.port, self.baud,
+                                                         self.scheduler, self.chord_tolerance,
+                                                         mode == 'binary')
+
+        elapsed = max(self.scheduler.now(), 1e-9)
+        stats = self.scheduler.lateness_stats()
+        print(f"✅ Playback complete or interrupted: sent {sent}/{len(events)} events, "
+              f"lateness p50 {stats['p50_ms']:.2f} ms, p99 {stats['p99_ms']:.2f} ms, "
+              f"max {stats['max_ms']:.2f} ms")
+        throughput = stream_throughput(groups, self.baud, rate=self.scheduler.rate)
+        print(f"📈 {sent / elapsed:.1f} events/s, {bytes_sent / elapsed:.0f} B/s; "
+              f"densest {throughput['window_ms']:.0f} ms: {throughput['peak_events_per_s']:.0f} events/s "
+              f"= {throughput['peak_bytes_per_s']:.0f} of {throughput['link_bytes_per_s']:.0f} B/s "
+              f"({throughput['headroom']:.1f}x headroom)")
         try:
             ser.flush()
-            ser.close()
         except Exception as e:
-            print(f"[Serial close error] {e}")
+            print(f"[Serial flush error] {e}")
+        self.completed = not self.scheduler.stopped
+
+def current_session():
+    """The current (or most recent) PlaybackSession, or None"""
+    return _current_session
+
+def _live_session():
+    session = _current_session
+    if session is not None and session.is_alive():
+        return session
+    return None
+
+def stop_playback(timeout=0.0):
+    """
+    Stop the current MIDI playback, if any, without waiting for its worker
+    to exit unless timeout is given
 
-    except Exception as e:
-        import traceback
-        print(f"[MIDI worker error] {e}")
-        traceback.print_exc()
+    Returns:
+        True if a playback was running and has been told to stop
+    """
+    with _lock:
+        session = _live_session()
+        if session is not None:
+            session.stop(timeout=timeout)
+            return True
+    return False
+
+def pause_playback():
+    """
+    Freeze the current playback at its position
+
+    Returns:
+        True if a playback was playing and is now paused
+    """
+    with _lock:
+        session = _live_session()
+        if session is not None and session.state() == 'playing':
+            session.pause()
+            return True
+    return False
+
+def resume_playback():
+    """
+    Continue a paused playback from where it was paused
+
+    Returns:
+        True if a paused playback was resumed
+    """
+    with _lock:
+        session = _live_session()
+        if session is not None and session.state() == 'paused':
+            session.resume()
+            return True
+    return False
+
+def set_playback_speed(playback_speed):
+    """
+    Change the speed of the current playback in place, from its current
+    position, without restarting it
 
-def play_midi(midi_file, start_time=0, playback_speed=1.0, port="COM3", baud=115200):
-    """Launch non-blocking MIDI playback, interrupting any current one."""
-    global _current_thread, _stop_flag
+    Returns:
+        True if a playback was running and picked up the new speed
+    """
+    if playback_speed <= 0:
+        raise ValueError(f"playback_speed must be positive, got {playback_speed}")
+    with _lock:
+        session = _live_session()
+        if session is not None:
+            session.set_speed(playback_speed)
+            return True
+    return False
+
+def playback_status():
+    """Status of the current (or most recent) playback, see PlaybackSession.status()"""
+    session = _current_session
+    if session is None:
+        return {'file': None, 'state': 'idle', 'position': 0.0, 'length': None,
+                'progress': 0.0, 'speed': 1.0}
+    return session.status()
+
+def scheduler_stats():
+    """Lateness stats of the current (or most recent) playback"""
+    if _current_session is None:
+        return PlaybackScheduler().lateness_stats()
+    return _current_session.scheduler.lateness_stats()
+
+def close_serial_connections():
+    """Close the pooled serial ports (they are also closed at exit)"""
+    _serial_pool.close_all()
+
+def play_midi(midi_file, start_time=0, playback_speed=1.0, port="COM3", baud=115200,
+              chord_tolerance=0.005, protocol="auto", paused=False):
+    """
+    Launch non-blocking MIDI playback, interrupting any current one.
+
+    playback_speed can be changed while playing with set_playback_speed(),
+    and paused=True starts the session paused at start_time.
+    Notes starting within chord_tolerance seconds of each other are sent
+    together in a single serial write. protocol picks the wire format, limited
+    to what the device agreed to when the port was opened:
+      "auto"/"timed" - timed frames streamed ahead, else binary, else ASCII
+      "binary"       - binary frames fired on arrival, else ASCII
+      "ascii"        - ASCII lines fired on arrival
+
+    Returns:
+        The new PlaybackSession
+    """
+    global _current_session
 
     with _lock:
-        # Stop any currently playing thread
-        if _current_thread and _current_thread.is_alive():
+        # Stop any currently playing session; the new worker waits for the
+        # old one to exit, so the caller never blocks on a thread join
+        previous = _live_session()
+        if previous is not None:
             print("⚠️ Stopping current MIDI playback...")
-            _stop_flag = True
-            _current_thread.join(timeout=1.0)
-
-        # Reset and start new one
-        _stop_flag = False
-        def thread_wrapper():
-            try:
-                _play_midi_worker(midi_file, start_time, playback_speed, port, baud)
-            except Exception as e:
-                import traceback
-                print("[Thread error] Exception in MIDI playback thread:", e)
-                traceback.print_exc()
-
-        _current_thread = threading.Thread(
-            target=thread_wrapper,
-            daemon=True
-        )
-    _current_thread.start()
-    print(f"🎶 Started new MIDI playback for {midi_file}")
\ No newline at end of file
+            previous.stop()
+
+        # Each playback gets its own session and scheduler, so a late-exiting
+        # old thread can never miss its stop signal
+        session = PlaybackSession(midi_file, start_time, playback_speed, port, baud,
+                                  chord_tolerance, protocol, paused)
+        session.previous = previous
+        _current_session = session
+    session.start()
+    print(f"🎶 Started new MIDI playback for {midi_file}")
+    return session
@@ -0,0 +1,162 @@
+"""
+MIDI Timeline Cache
+Compiles a MIDI file once into a compact columnar note timeline
+(onset seconds, note, velocity, duration seconds as NumPy arrays).
+Timelines are kept in an in-process LRU and persisted as .npz files,
+so later plays skip MIDI parsing entirely
+"""
+import glob
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+
+import metrics
+
+CACHE_DIR_NAME = ".timeline_cache"
+MAX_MEMORY_ENTRIES = 32
+
+_memory_cache = OrderedDict()  # cache key -> Timeline
+_memory_lock = threading.Lock()
+cache_stats = {'memory_hits': 0, 'disk_hits': 0, 'compiles': 0}
+
+
+class Timeline:
+    """Note events of one MIDI file as parallel arrays, sorted by onset"""
+
+    __slots__ = ('onset', 'note', 'velocity', 'duration')
+
+    def __init__(self, onset, note, velocity, duration):
+        self.onset = onset          # float64 seconds from the start of the file
+        self.note = note            # int16 MIDI note numbers
+        self.velocity = velocity    # int16 MIDI velocities
+        self.duration = duration    # float64 seconds
+
+    def __len__(self):
+        return len(self.onset)
+
+    @property
+    def length(self):
+        """Time in seconds at which the last note ends"""
+        if not len(self.onset):
+            return 0.0
+        return float(np.max(self.onset + self.duration))
+
+
+def compile_timeline(midi_file, mid=None):
+    """
+    Parse a MIDI file into a Timeline
+
+    Note-ons are paired with the next note-off of the same pitch (first in,
+    first out); notes that are never released are dropped. Pass mid (an
+    already parsed mido.MidiFile) to skip parsing the file again.
+    """
+    import mido
+
+    if mid is None:
+        mid = mido.MidiFile(midi_file)
+    onsets, notes, velocities, durations = [], [], [], []
+    pending_notes = {}
+
+    time_acc = 0.0
+    for msg in mid:
+        time_acc += msg.time
+        if msg.type == 'note_on' and msg.velocity > 0:
+            pending_notes.setdefault(msg.note, []).append((time_acc, msg.velocity))
+        elif msg.type == 'note_off' or (msg.type == 'note_on' and msg.velocity == 0):
+            if pending_notes.get(msg.note):
+                start, velocity = pending_notes[msg.note].pop(0)
+                onsets.append(start)
+                notes.append(msg.note)
+                velocities.append(velocity)
+                durations.append(time_acc - start)
+
+    onset = np.array(onsets, dtype=np.float64)
+    order = np.argsort(onset, kind='stable')
+    return Timeline(onset[order],
+                    np.array(notes, dtype=np.int16)[order],
+                    np.array(velocities, dtype=np.int16)[order],
+                    np.array(durations, dtype=np.float64)[order])
+
+
+def _cache_key(midi_file):
+    """Key a file by path, size and modification time"""
+    stat = midi_file.stat()
+    raw = f"{midi_file}|{stat.st_size}|{stat.st_mtime_ns}"
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()[:16]
+
+
+def _cache_path(midi_file, key):
+    return midi_file.parent / CACHE_DIR_NAME / f"{midi_file.stem}-{key}.npz"
+
+
+def load_timeline(midi_file, mid=None):
+    """
+    Get the Timeline for a MIDI file, compiling it only if no cached copy
+    (in memory or on disk) matches the file's current size and mtime
+
+    Args:
+        mid: Already parsed mido.MidiFile to compile from on a cache miss
+    """
+    midi_file = Path(midi_file).expanduser().resolve()
+    key = _cache_key(midi_file)
+
+    with _memory_lock:
+        timeline = _memory_cache.get(key)
+        if timeline is not None:
+            _memory_cache.move_to_end(key)
+            cache_stats['memory_hits'] += 1
+            metrics.cache_hits.inc(cache='timeline')
+            return timeline
+
+    cache_path = _cache_path(midi_file, key)
+    try:
+        with np.load(cache_path) as data:
+            timeline = Timeline(data['onset'], data['note'], data['velocity'], data['duration'])
+        cache_stats['disk_hits'] += 1
+        metrics.cache_hits.inc(cache='timeline')
+    except (OSError, KeyError, ValueError):
+        with metrics.midi_parse_seconds.time():
+            timeline = compile_timeline(midi_file, mid)
+        cache_stats['compiles'] += 1
+        metrics.cache_misses.inc(cache='timeline')
+        _save_timeline(midi_file, cache_path, timeline)
+
+    with _memory_lock:
+        _memory_cache[key] = timeline
+        while len(_memory_cache) > MAX_MEMORY_ENTRIES:
+            _memory_cache.popitem(last=False)
+    return timeline
+
+
+def drop_cached_timeline(midi_file):
+    """Delete the on-disk timelines of a MIDI file, e.g. once it leaves the library"""
+    midi_file = Path(midi_file).expanduser().resolve()
+    try:
+        _remove_cached(midi_file.parent / CACHE_DIR_NAME, midi_file)
+    except OSError as e:
+        print(f"[Timeline cache] Could not remove the timeline of {midi_file.name}: {e}")
+
+
+def _remove_cached(cache_dir, midi_file):
+    """Delete every timeline cached in cache_dir for midi_file"""
+    # Escaped, as song names often have [brackets] (glob character classes)
+    for cached in cache_dir.glob(f"{glob.escape(midi_file.stem)}-*.npz"):
+        if cached.stem.rsplit('-', 1)[0] == midi_file.stem:
+            cached.unlink()
+
+
+def _save_timeline(midi_file, cache_path, timeline):
+    """Persist a timeline, replacing stale copies for the same MIDI file"""
+    try:
+        cache_path.parent.mkdir(exist_ok=True)
+        _remove_cached(cache_path.parent, midi_file)
+        tmp_path = cache_path.with_name(cache_path.stem + ".tmp.npz")
+        np.savez(tmp_path, onset=timeline.onset, note=timeline.note,
+                 velocity=timeline.velocity, duration=timeline.duration)
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        print(f"[Timeline cache] Could not write {cache_path}: {e}")
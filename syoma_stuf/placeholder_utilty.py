@@ -1,6 +1,7 @@
 """
 Example utility module for MIDI playback control.
 """
+import midi_stream_to_arduino as mid
 
 
 def play(midi_file, timestamp=0.0, playback_speed=1.0):
@@ -63,12 +64,8 @@ def get_current_timestamp():
         Current timestamp normalized from 0.0 to 1.0.
         0.0 = beginning, 1.0 = end of the file.
     """
-    # This is a placeholder - in a real implementation,
-    # this would track the actual playback position
-    current_timestamp = 0.42  # Example value
-    
-    print(f"Current playback timestamp: {current_timestamp} ({current_timestamp * 100:.1f}%)")
-    return current_timestamp
+    # O(1): read from the current PlaybackSession's clock, so UIs can poll it freely
+    return mid.playback_status()['progress']
 
 
 # Example usage
@@ -3,163 +3,434 @@ MIDI Piano Player
 Takes a MIDI file and plays it using piano sounds with real-time synthesis
 Supports polyphony (multiple notes at once)
 """
+import heapq
 import mido
 import time
+import wave
 import numpy as np
-import sounddevice as sd
 from pathlib import Path
-import threading
-from collections import defaultdict
+from collections import deque, OrderedDict
+
+import metrics
 
 # Piano note frequencies (A4 = 440 Hz)
 def note_to_freq(note):
     """Convert MIDI note number to frequency in Hz"""
     return 440.0 * (2.0 ** ((note - 69) / 12.0))
 
-class PolyphonicSynthesizer:
-    """Synthesizer that can play multiple notes simultaneously"""
+class SampleCache:
+    """
+    Pre-rendered tones for sampler mode, one loop buffer per (note, velocity layer)
     
-    def __init__(self, sample_rate=44100):
+    Buffers are rendered once on first use and kept in an LRU that evicts the
+    least recently used tones once the memory cap is exceeded.
+    """
+    
+    def __init__(self, sample_rate=44100, max_bytes=64 * 1024 * 1024,
+                 velocity_layers=4, loop_seconds=1.0, render_tone=None):
         self.sample_rate = sample_rate
-        self.active_notes = {}  # note -> note info dict
-        self.releasing_notes = {}  # notes in release phase
-        self.lock = threading.Lock()
-        self.master_volume = 0.12
+        self.max_bytes = max_bytes
+        self.velocity_layers = velocity_layers
+        self.loop_seconds = loop_seconds
+        self.render_tone = render_tone or self._render_harmonic_tone
+        self._buffers = OrderedDict()  # (note, layer) -> float32 loop buffer
+        self.bytes_used = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    def layer_for(self, velocity):
+        """Map a MIDI velocity (1-127) to a velocity layer index"""
+        return min(self.velocity_layers - 1, velocity * self.velocity_layers // 128)
+    
+    def get(self, note, velocity):
+        """Return the loop buffer for note at velocity, rendering it if needed"""
+        key = (note, self.layer_for(velocity))
+        buffer = self._buffers.get(key)
+        if buffer is not None:
+            self.hits += 1
+            self._buffers.move_to_end(key)
+            return buffer
         
-    def note_on(self, note, velocity):
-        """Start playing a note"""
-        with self.lock:
-            # Remove from releasing if it was there
-            if note in self.releasing_notes:
-                del self.releasing_notes[note]
-            
-            self.active_notes[note] = {
-                'phases': [0.0] * 5,  # One phase per harmonic
-                'velocity': velocity / 127.0,
-                'start_time': time.time(),
-                'sample_count': 0
-            }
-    
-    def note_off(self, note):
-        """Stop playing a note (move to release phase)"""
-        with self.lock:
-            if note in self.active_notes:
-                # Move to releasing notes instead of deleting
-                self.releasing_notes[note] = self.active_notes[note]
-                self.releasing_notes[note]['release_start'] = time.time()
-                del self.active_notes[note]
+        self.misses += 1
+        buffer = np.ascontiguousarray(
+            self.render_tone(note, key[1], self._loop_length(note)), dtype=np.float32)
+        self._buffers[key] = buffer
+        self.bytes_used += buffer.nbytes
+        while self.bytes_used > self.max_bytes and len(self._buffers) > 1:
+            _, evicted = self._buffers.popitem(last=False)
+            self.bytes_used -= evicted.nbytes
+            self.evictions += 1
+        return buffer
     
-    def generate_sample(self, num_samples):
-        """Generate audio samples for all active notes"""
+    def warm(self, notes):
+        """Pre-render (note, velocity) pairs so playback never renders in the callback"""
+        for note, velocity in notes:
+            self.get(note, velocity)
+    
+    def _loop_length(self, note):
+        """
+        Pick a loop length close to loop_seconds that holds an almost whole
+        number of periods, so the loop point does not click
+        """
+        period = self.sample_rate / note_to_freq(note)
+        target = max(1, int(round(self.loop_seconds * self.sample_rate / period)))
+        periods = np.arange(target, 2 * target + 1)
+        lengths = periods * period
+        best = np.argmin(np.abs(lengths - np.round(lengths)))
+        return int(round(lengths[best]))
+    
+    def _render_harmonic_tone(self, note, layer, length):
+        """Same harmonic stack as the live oscillators, darker at softer layers"""
+        brightness = 0.7 + 0.3 * (layer + 1) / self.velocity_layers
+        phase = 2 * np.pi * note_to_freq(note) / self.sample_rate * np.arange(length)
+        tone = np.zeros(length, dtype=np.float64)
+        for k, amp in enumerate(OscillatorBank.HARMONIC_AMPS):
+            tone += amp * brightness ** k * np.sin((k + 1) * phase)
+        return tone
+
+
+class OscillatorBank:
+    """
+    Fixed-capacity voice table: oscillator state for every sounding voice,
+    kept in contiguous NumPy arrays that are allocated once
+    
+    Live voices always occupy slots [0, count), so a block is rendered for all
+    voices and harmonics in one broadcasted pass without gathering. When a
+    SampleCache is given, voices play cached loop buffers instead (sampler mode).
+    
+    At most max_voices sound at once; a new note beyond that steals a voice,
+    preferring the one released longest ago, then the quietest held voice.
+    """
+    
+    HARMONIC_AMPS = (1.0, 0.5, 0.25, 0.125, 0.0625)
+    VOICE_FIELDS = ('note', 'phase', 'phase_inc', 'velocity',
+                    'sample_count', 'releasing', 'release_count')
+    
+    def __init__(self, sample_rate=44100, max_voices=64, sample_cache=None):
+        self.sample_rate = sample_rate
+        self.sample_cache = sample_cache
+        self.max_voices = max_voices
+        self.count = 0
+        self.peak_voices = 0
+        self.steals = 0
+        self.attack_samples = int(0.005 * sample_rate)  # 5ms attack
+        self.decay_samples = int(0.1 * sample_rate)     # 100ms decay
+        self.release_samples = int(0.3 * sample_rate)   # 300ms release
+        self.sustain_level = 0.7
+        self.slot_of_note = np.full(128, -1, dtype=np.int64)
+        
+        self.note = np.zeros(max_voices, dtype=np.int64)
+        self.phase = np.zeros(max_voices, dtype=np.float64)       # fundamental phase
+        self.phase_inc = np.zeros(max_voices, dtype=np.float64)   # radians per sample
+        self.velocity = np.zeros(max_voices, dtype=np.float64)
+        self.sample_count = np.zeros(max_voices, dtype=np.int64)
+        self.releasing = np.zeros(max_voices, dtype=bool)
+        self.release_count = np.zeros(max_voices, dtype=np.int64)  # samples since release
+        self.buffers = [None] * max_voices  # sampler mode loop buffers
+        self._ramp = np.arange(2048, dtype=np.float64)
+    
+    def start_voice(self, note, velocity):
+        """Start a voice for note, replacing any voice already tied to it"""
+        slot = self.slot_of_note[note]
+        if slot < 0:
+            if self.count == self.max_voices:
+                self._free_slot(self._pick_victim())
+                self.steals += 1
+                metrics.dropped_notes.inc(reason='voice_stolen')
+            slot = self.count
+            self.count += 1
+            self.peak_voices = max(self.peak_voices, self.count)
+            self.slot_of_note[note] = slot
+        
+        self.note[slot] = note
+        self.phase[slot] = 0.0
+        self.phase_inc[slot] = 2 * np.pi * note_to_freq(note) / self.sample_rate
+        self.velocity[slot] = velocity / 127.0
+        self.sample_count[slot] = 0
+        self.releasing[slot] = False
+        if self.sample_cache is not None:
+            self.buffers[slot] = self.sample_cache.get(note, velocity)
+    
+    def release_voice(self, note):
+        """Move the held voice for note into its release phase"""
+        slot = self.slot_of_note[note]
+        if slot >= 0 and not self.releasing[slot]:
+            self.releasing[slot] = True
+            self.release_count[slot] = 0
+    
+    def _pick_victim(self):
+        """Slot to steal: the longest-released voice, else the quietest held one"""
+        n = self.count
+        released = np.flatnonzero(self.releasing[:n])
+        if len(released):
+            return released[np.argmax(self.release_count[released])]
+        # Notes still in their attack count as full level, so a note that has
+        # only just started is never the one that gets cut
+        envelope = self._envelope(np.arange(n), self._ramp[:1])[:, 0]
+        envelope[self.sample_count[:n] < self.attack_samples] = 1.0
+        return int(np.argmin(envelope * self.velocity[:n]))
+    
+    def _free_slot(self, slot):
+        """Free a slot by moving the last live voice into it"""
+        self.slot_of_note[self.note[slot]] = -1
+        last = self.count - 1
+        if slot != last:
+            for name in self.VOICE_FIELDS:
+                array = getattr(self, name)
+                array[slot] = array[last]
+            self.buffers[slot] = self.buffers[last]
+            self.slot_of_note[self.note[slot]] = slot
+        self.buffers[last] = None
+        self.count = last
+    
+    def render(self, num_samples):
+        """Render and mix all voices for one block (before master volume)"""
+        n = self.count
+        if n == 0:
+            return np.zeros(num_samples, dtype=np.float32)
+        ramp = self._index_ramp(num_samples)
+        
+        if self.sample_cache is not None:
+            tone = self._sampled_tone(n, ramp)
+        else:
+            tone = self._oscillator_tone(n, ramp)
+        
+        # Voices sitting at the sustain level have a constant gain, so they mix
+        # with one matrix-vector product; only attacking, decaying and releasing
+        # voices need a per-sample envelope
+        transient = self.releasing[:n] | (self.sample_count[:n]
+                                          < self.attack_samples + self.decay_samples)
+        steady = np.flatnonzero(~transient)
+        moving = np.flatnonzero(transient)
+        
         output = np.zeros(num_samples, dtype=np.float32)
+        if len(steady):
+            weights = (self.sustain_level * self.velocity[steady]).astype(np.float32)
+            output += weights @ tone[steady]
+        if len(moving):
+            gain = self._envelope(moving, ramp)
+            gain *= self.velocity[moving, None]
+            output += np.einsum('vs,vs->s', tone[moving], gain.astype(np.float32))
         
-        with self.lock:
-            # Process active notes
-            for note, info in list(self.active_notes.items()):
-                tone = self._generate_note_samples(note, info, num_samples, False)
-                output += tone
-            
-            # Process releasing notes
-            for note, info in list(self.releasing_notes.items()):
-                tone = self._generate_note_samples(note, info, num_samples, True)
-                output += tone
-                
-                # Remove if release is complete
-                release_time = time.time() - info['release_start']
-                if release_time > 0.3:  # 300ms release
-                    del self.releasing_notes[note]
+        # Advance state for the next block, keeping phases wrapped
+        self.phase[:n] = (self.phase[:n] + self.phase_inc[:n] * num_samples) % (2 * np.pi)
+        self.sample_count[:n] += num_samples
+        self.release_count[:n] += num_samples
         
-        # Soft limiting to prevent clipping
-        output = np.tanh(output)
+        # Drop voices whose release has finished
+        done = np.flatnonzero(self.releasing[:n] & (self.release_count[:n] >= self.release_samples))
+        for slot in done[::-1]:
+            self._free_slot(slot)
         
         return output
     
-    def _generate_note_samples(self, note, info, num_samples, is_releasing):
-        """Generate samples for a single note"""
-        freq = note_to_freq(note)
-        velocity = info['velocity']
-        
-        # Generate tone with harmonics
-        tone = np.zeros(num_samples, dtype=np.float32)
-        harmonics = [1.0, 0.5, 0.25, 0.125, 0.0625]
+    def _oscillator_tone(self, n, ramp):
+        """Synthesize the harmonic stack for the first n voices: (voices, samples)"""
+        # Fundamental phase of every voice for every sample: (voices, samples)
+        # (float32 is plenty for the per-sample math and halves memory traffic)
+        phase = (self.phase[:n, None] + self.phase_inc[:n, None] * ramp).astype(np.float32)
         
-        for i, amp in enumerate(harmonics):
-            harmonic_freq = freq * (i + 1)
-            
-            # Generate continuous phase
-            phase_inc = 2 * np.pi * harmonic_freq / self.sample_rate
-            phases = info['phases'][i] + phase_inc * np.arange(num_samples)
-            
-            tone += amp * np.sin(phases)
-            
-            # Update phase for next buffer, keeping it wrapped
-            info['phases'][i] = (phases[-1] + phase_inc) % (2 * np.pi)
+        # Harmonics via the Chebyshev recurrence sin((k+1)x) = 2cos(x)sin(kx) - sin((k-1)x),
+        # so each block needs one sin and one cos per voice instead of one sin per harmonic
+        sin_k = np.sin(phase)
+        two_cos = 2.0 * np.cos(phase)
+        tone = self.HARMONIC_AMPS[0] * sin_k
+        sin_prev = np.zeros_like(sin_k)
+        for amp in self.HARMONIC_AMPS[1:]:
+            sin_k, sin_prev = two_cos * sin_k - sin_prev, sin_k
+            tone += amp * sin_k
+        return tone
+    
+    def _sampled_tone(self, n, ramp):
+        """Read the first n voices out of their cached loop buffers: (voices, samples)"""
+        tone = np.empty((n, len(ramp)), dtype=np.float32)
+        offsets = ramp.astype(np.int64)
+        for slot in range(n):
+            np.take(self.buffers[slot], self.sample_count[slot] + offsets,
+                    out=tone[slot], mode='wrap')
+        return tone
+    
+    def _envelope(self, slots, ramp):
+        """ADSR envelope for the given voice slots: (voices, samples)"""
+        sample_num = self.sample_count[slots, None] + ramp
+        attack = sample_num / self.attack_samples
+        decay_progress = np.clip((sample_num - self.attack_samples) / self.decay_samples, 0.0, 1.0)
+        envelope = np.minimum(attack, 1.0 - decay_progress * (1.0 - self.sustain_level))
         
-        # Apply envelope
-        envelope = self._get_envelope_samples(info, num_samples, is_releasing)
-        tone *= envelope * velocity * self.master_volume
+        releasing = self.releasing[slots]
+        if releasing.any():
+            # Release phase: linear fade from sustain level down to silence
+            progress = (self.release_count[slots, None] + ramp) / self.release_samples
+            release = self.sustain_level * (1.0 - np.clip(progress, 0.0, 1.0))
+            envelope = np.where(releasing[:, None], release, envelope)
         
-        # Update sample count
-        info['sample_count'] += num_samples
+        return envelope
+    
+    def _index_ramp(self, num_samples):
+        """Return [0, 1, ..., num_samples - 1], reusing one cached array"""
+        if len(self._ramp) < num_samples:
+            self._ramp = np.arange(num_samples, dtype=np.float64)
+        return self._ramp[:num_samples]
+
+
+class PolyphonicSynthesizer:
+    """
+    Synthesizer that can play multiple notes simultaneously
+    
+    note_on/note_off never touch the voices directly: they append to a
+    single-producer/single-consumer event queue (collections.deque appends and
+    pops are atomic) that the audio callback drains at the start of each block,
+    so neither side ever waits on a lock.
+    
+    Events can carry a target sample frame on the synth's own timeline
+    (self.frame counts frames rendered so far). The renderer splits the block
+    at each event's offset, so notes start and stop on the exact frame no
+    matter where the block boundaries fall.
+    """
+    
+    def __init__(self, sample_rate=44100, sample_cache=None, max_voices=64):
+        self.sample_rate = sample_rate
+        self.bank = OscillatorBank(sample_rate, max_voices=max_voices, sample_cache=sample_cache)
+        self.master_volume = 0.12
+        self.frame = 0  # frames rendered so far
+        self.events = deque()  # (frame, note, velocity, queued_at); velocity 0 = note off
+        self.event_latency = deque(maxlen=4096)  # seconds from queueing to being applied
+        self.late_events = 0  # timestamped events that arrived after their frame
+        self._pending = []  # heap of drained events waiting for their frame
+        self._event_seq = 0
         
-        return tone
+    def note_on(self, note, velocity, frame=None):
+        """Start playing a note, at the given sample frame or as soon as possible"""
+        self.events.append((frame, note, velocity, time.perf_counter()))
+    
+    def note_off(self, note, frame=None):
+        """Stop playing a note (move to release phase)"""
+        self.events.append((frame, note, 0, time.perf_counter()))
     
-    def _get_envelope_samples(self, info, num_samples, is_releasing):
-        """Generate smooth ADSR envelope samples"""
-        envelope = np.ones(num_samples, dtype=np.float32)
+    def generate_sample(self, num_samples):
+        """Generate audio samples for all active notes"""
+        self._drain_events()
+        block_start = self.frame
+        block_end = block_start + num_samples
         
-        attack_samples = int(0.005 * self.sample_rate)  # 5ms attack
-        decay_samples = int(0.1 * self.sample_rate)     # 100ms decay
-        sustain_level = 0.7
+        if not self._pending or self._pending[0][0] >= block_end:
+            output = self.bank.render(num_samples)
+        else:
+            # Render up to each event's offset, apply it, then carry on
+            output = np.empty(num_samples, dtype=np.float32)
+            position = 0
+            while self._pending and self._pending[0][0] < block_end:
+                frame, _, note, velocity, queued_at = heapq.heappop(self._pending)
+                offset = frame - block_start
+                if offset < 0:
+                    self.late_events += 1
+                    offset = 0
+                if offset > position:
+                    output[position:offset] = self.bank.render(offset - position)
+                    position = offset
+                self._apply_event(note, velocity, queued_at)
+            if position < num_samples:
+                output[position:] = self.bank.render(num_samples - position)
         
-        if is_releasing:
-            # Release phase
-            release_samples = int(0.3 * self.sample_rate)  # 300ms release
-            release_time = time.time() - info['release_start']
-            release_sample_count = int(release_time * self.sample_rate)
-            
-            for i in range(num_samples):
-                progress = (release_sample_count + i) / release_samples
-                if progress < 1.0:
-                    envelope[i] = sustain_level * (1.0 - progress)
-                else:
-                    envelope[i] = 0.0
+        self.frame = block_end
+        
+        # Soft limiting to prevent clipping
+        output = np.tanh(output * np.float32(self.master_volume))
+        
+        return output
+    
+    def _drain_events(self):
+        """Move every queued note event onto the pending heap"""
+        while True:
+            try:
+                frame, note, velocity, queued_at = self.events.popleft()
+            except IndexError:
+                break
+            if frame is None:
+                frame = self.frame
+            # The sequence number keeps events on the same frame in arrival order
+            heapq.heappush(self._pending, (frame, self._event_seq, note, velocity, queued_at))
+            self._event_seq += 1
+    
+    def _apply_event(self, note, velocity, queued_at):
+        """Start or release a voice and record how long the event took to land"""
+        if velocity > 0:
+            self.bank.start_voice(note, velocity)
         else:
-            # Attack/Decay/Sustain phase
-            start_sample = info['sample_count']
-            
-            for i in range(num_samples):
-                sample_num = start_sample + i
-                
-                if sample_num < attack_samples:
-                    # Attack
-                    envelope[i] = sample_num / attack_samples
-                elif sample_num < attack_samples + decay_samples:
-                    # Decay
-                    decay_progress = (sample_num - attack_samples) / decay_samples
-                    envelope[i] = 1.0 - decay_progress * (1.0 - sustain_level)
-                else:
-                    # Sustain
-                    envelope[i] = sustain_level
+            self.bank.release_voice(note)
+        self.event_latency.append(time.perf_counter() - queued_at)
+    
+    def latency_stats(self):
+        """
+        Scheduler-to-callback event latency over the recent events
         
-        return envelope
+        Returns:
+            Dict with p50/p99/max latency in milliseconds, the event count
+            and how many timestamped events arrived too late for their frame
+        """
+        if not self.event_latency:
+            return {'events': 0, 'p50_ms': 0.0, 'p99_ms': 0.0, 'max_ms': 0.0,
+                    'late_events': self.late_events}
+        latency_ms = 1000.0 * np.array(self.event_latency)
+        return {
+            'events': len(latency_ms),
+            'p50_ms': float(np.percentile(latency_ms, 50)),
+            'p99_ms': float(np.percentile(latency_ms, 99)),
+            'max_ms': float(latency_ms.max()),
+            'late_events': self.late_events,
+        }
+
+    def voice_stats(self):
+        """Current and peak voice counts plus how many voices were stolen"""
+        return {
+            'voices': self.bank.count,
+            'peak_voices': self.bank.peak_voices,
+            'max_voices': self.bank.max_voices,
+            'steals': self.bank.steals,
+        }
+
+def midi_note_events(mid, sample_rate):
+    """
+    Flatten a MIDI file into note events on a sample-frame timeline
+    
+    Returns:
+        List of (frame, note, velocity) tuples in playback order; velocity 0 = note off
+    """
+    events = []
+    seconds = 0.0
+    for msg in mid:
+        seconds += msg.time
+        if msg.type == 'note_on' and msg.velocity > 0:
+            events.append((int(round(seconds * sample_rate)), msg.note, msg.velocity))
+        elif msg.type == 'note_off' or (msg.type == 'note_on' and msg.velocity == 0):
+            events.append((int(round(seconds * sample_rate)), msg.note, 0))
+    return events
 
 def audio_callback(outdata, frames, time_info, status):
     """Callback function for audio stream"""
     if status:
         print(f"Audio status: {status}")
+        if status.output_underflow:
+            metrics.audio_underruns.inc()
     
+    started = time.perf_counter()
     samples = synthesizer.generate_sample(frames)
     outdata[:, 0] = samples
+    metrics.audio_render_seconds.observe(time.perf_counter() - started)
 
-def play_midi(midi_file):
+def play_midi(midi_file, sampler=False, cache_mb=64, max_voices=64):
     """
     Play a MIDI file using real-time polyphonic synthesis
     
     Args:
         midi_file: Path to the MIDI file to play
+        sampler: Play pre-rendered cached tones instead of live oscillators
+        cache_mb: Memory cap for the sampler cache in megabytes
+        max_voices: Maximum polyphony before voices get stolen
     """
     global synthesizer
+    import sounddevice as sd
     
     # Check if file exists
     if not Path(midi_file).exists():
@@ -176,21 +447,48 @@ def play_midi(midi_file):
     print("   Press Ctrl+C to stop playback")
     
     sample_rate = 44100
-    synthesizer = PolyphonicSynthesizer(sample_rate)
+    blocksize = 2048
+    sample_cache = None
+    if sampler:
+        # Render every tone the song needs up front, outside the audio callback
+        sample_cache = SampleCache(sample_rate, max_bytes=cache_mb * 1024 * 1024)
+        sample_cache.warm({(msg.note, msg.velocity) for msg in mid
+                           if msg.type == 'note_on' and msg.velocity > 0})
+        print(f"🎼 Sampler mode: {len(sample_cache._buffers)} tones cached "
+              f"({sample_cache.bytes_used / 1e6:.1f} MB)")
+    synthesizer = PolyphonicSynthesizer(sample_rate, sample_cache=sample_cache,
+                                        max_voices=max_voices)
     
     try:
         # Start audio stream with callback
         with sd.OutputStream(samplerate=sample_rate, channels=1, 
-                            callback=audio_callback, blocksize=2048):
-            # Play through all MIDI messages
-            for msg in mid.play():
-                if msg.type == 'note_on' and msg.velocity > 0:
-                    synthesizer.note_on(msg.note, msg.velocity)
-                elif msg.type == 'note_off' or (msg.type == 'note_on' and msg.velocity == 0):
-                    synthesizer.note_off(msg.note)
+                            callback=audio_callback, blocksize=blocksize):
+            # Queue events a little ahead of the audio clock, each stamped with
+            # its exact frame so block boundaries do not smear the timing
+            lookahead = max(4 * blocksize, sample_rate // 10)
+            start_frame = synthesizer.frame + 2 * blocksize
+            end_frame = start_frame
+            for frame, note, velocity in midi_note_events(mid, sample_rate):
+                target = start_frame + frame
+                while target - synthesizer.frame > lookahead:
+                    time.sleep((target - synthesizer.frame - lookahead) / sample_rate)
+                if velocity > 0:
+                    synthesizer.note_on(note, velocity, frame=target)
+                else:
+                    synthesizer.note_off(note, frame=target)
+                end_frame = target
             
             # Let final notes decay
-            time.sleep(0.5)
+            while synthesizer.frame < end_frame + synthesizer.bank.release_samples + blocksize:
+                time.sleep(blocksize / sample_rate)
+        
+        stats = synthesizer.latency_stats()
+        print(f"⏱️  Event latency: p50 {stats['p50_ms']:.1f} ms, "
+              f"p99 {stats['p99_ms']:.1f} ms over {stats['events']} events, "
+              f"{stats['late_events']} late")
+        voices = synthesizer.voice_stats()
+        print(f"🎚️  Voices: peak {voices['peak_voices']}/{voices['max_voices']}, "
+              f"{voices['steals']} stolen")
         
     except KeyboardInterrupt:
         print("\n⏹️  Playback stopped by user")
@@ -202,11 +500,100 @@ def play_midi(midi_file):
     print("✅ Finished")
 
 
+def render_midi(midi_file, output_path, sample_rate=44100, blocksize=4096,
+                sampler=False, cache_mb=64, max_voices=64):
+    """
+    Render a MIDI file to a WAV or raw PCM file as fast as possible, no audio device needed
+    
+    Args:
+        midi_file: Path to the MIDI file to render
+        output_path: .wav for 16-bit PCM WAV, anything else for raw float32 PCM
+        sample_rate: Output sample rate in Hz
+        blocksize: Frames rendered per synth call
+        sampler: Render with pre-rendered cached tones instead of live oscillators
+        cache_mb: Memory cap for the sampler cache in megabytes
+        max_voices: Maximum polyphony before voices get stolen
+    
+    Returns:
+        Dict with audio duration, render time, real-time factor and voice counts
+    """
+    started = time.perf_counter()
+    mid = mido.MidiFile(midi_file)
+    events = midi_note_events(mid, sample_rate)
+    
+    sample_cache = None
+    if sampler:
+        sample_cache = SampleCache(sample_rate, max_bytes=cache_mb * 1024 * 1024)
+        sample_cache.warm({(note, velocity) for _, note, velocity in events if velocity > 0})
+    synth = PolyphonicSynthesizer(sample_rate, sample_cache=sample_cache, max_voices=max_voices)
+    
+    # Every event is known up front, so queue them all with their exact frames
+    for frame, note, velocity in events:
+        if velocity > 0:
+            synth.note_on(note, velocity, frame=frame)
+        else:
+            synth.note_off(note, frame=frame)
+    
+    last_frame = events[-1][0] if events else 0
+    total_frames = last_frame + synth.bank.release_samples
+    audio = np.empty(total_frames, dtype=np.float32)
+    for start in range(0, total_frames, blocksize):
+        frames = min(blocksize, total_frames - start)
+        audio[start:start + frames] = synth.generate_sample(frames)
+    
+    output_path = Path(output_path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    if output_path.suffix.lower() == '.wav':
+        pcm = (np.clip(audio, -1.0, 1.0) * 32767).astype('<i2')
+        with wave.open(str(output_path), 'wb') as wav:
+            wav.setnchannels(1)
+            wav.setsampwidth(2)
+            wav.setframerate(sample_rate)
+            wav.writeframes(pcm.tobytes())
+    else:
+        audio.astype('<f4').tofile(output_path)
+    
+    render_seconds = time.perf_counter() - started
+    duration = total_frames / sample_rate
+    return {
+        'file': str(midi_file),
+        'output': str(output_path),
+        'duration_s': duration,
+        'render_s': render_seconds,
+        'realtime_factor': duration / render_seconds if render_seconds > 0 else float('inf'),
+        'peak_voices': synth.bank.peak_voices,
+        'steals': synth.bank.steals,
+    }
+
+
 def main():
     """Main function to handle command line arguments"""
-    # Hardcoded MIDI file path
-    midi_file = "syoma_stuf\midi_folder\Beethhoven_-_Beethoven_-_9th_Symphony_(Ode_To_Joy)_[Easy_Piano_Tutorial].mid"
-    play_midi(midi_file)
+    import argparse
+    
+    # Hardcoded default MIDI file path
+    default_midi = "syoma_stuf\midi_folder\Beethhoven_-_Beethoven_-_9th_Symphony_(Ode_To_Joy)_[Easy_Piano_Tutorial].mid"
+    
+    parser = argparse.ArgumentParser(description="Play a MIDI file with the polyphonic synth")
+    parser.add_argument("midi_file", nargs="?", default=default_midi)
+    parser.add_argument("--sampler", action="store_true",
+                        help="play cached pre-rendered tones (lower CPU per voice)")
+    parser.add_argument("--cache-mb", type=int, default=64,
+                        help="memory cap for the sampler tone cache")
+    parser.add_argument("--max-voices", type=int, default=64,
+                        help="maximum polyphony before voices get stolen")
+    parser.add_argument("--render", metavar="OUTPUT",
+                        help="render offline to a .wav (or raw float32 PCM) file instead of playing")
+    args = parser.parse_args()
+    
+    if args.render:
+        result = render_midi(args.midi_file, args.render, sampler=args.sampler,
+                             cache_mb=args.cache_mb, max_voices=args.max_voices)
+        print(f"💾 Rendered {result['duration_s']:.1f}s of audio to {result['output']} "
+              f"in {result['render_s']:.2f}s ({result['realtime_factor']:.0f}x real time), "
+              f"peak {result['peak_voices']} voices, {result['steals']} stolen")
+    else:
+        play_midi(args.midi_file, sampler=args.sampler, cache_mb=args.cache_mb,
+                  max_voices=args.max_voices)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,128 @@
+"""
+Playback Event Stream
+One broadcaster thread turns playback status into server-sent events: a
+"state" event whenever the song, its length, play/pause state or speed
+changes, and a "tick" with the position (and length) every interval while
+playing. Each event is encoded once and handed to every subscriber as the
+same bytes, so a tick costs the same server work for one browser tab as for
+fifty
+"""
+import json
+import threading
+import time
+from collections import deque
+
+
+def encode_event(kind, payload):
+    """One server-sent event: event name plus JSON data"""
+    return f"event: {kind}\ndata: {json.dumps(payload)}\n\n".encode()
+
+
+class PlaybackBroadcaster:
+    """Polls a status function and fans its changes out to any number of subscribers"""
+
+    def __init__(self, status, interval=0.25, keepalive=15.0, backlog=16):
+        self.status = status  # callable returning a dict like midi_stream_to_arduino.playback_status()
+        self.interval = interval
+        self.keepalive = keepalive  # seconds of silence before a subscriber gets a comment line
+        self.subscribers = 0
+        self.published = 0
+        self._condition = threading.Condition()
+        self._recent = deque(maxlen=backlog)  # (sequence number, encoded event)
+        self._seq = 0
+        self._state_event = None  # latest "state" event, for subscribers that fell behind
+        self._wake = threading.Event()
+        self._thread = None
+        self._thread_lock = threading.Lock()
+
+    def start(self):
+        """Start the broadcaster thread (done by the first subscribe())"""
+        with self._thread_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+
+    def poke(self):
+        """Check the status now instead of at the next tick, e.g. right after a command"""
+        self._wake.set()
+
+    def _publish(self, kind, payload):
+        event = encode_event(kind, payload)
+        with self._condition:
+            self._seq += 1
+            self._recent.append((self._seq, event))
+            if kind == 'state':
+                self._state_event = event
+            self.published += 1
+            self._condition.notify_all()
+
+    def _run(self):
+        last_state = None
+        while True:
+            if self.subscribers:
+                status = self.status()
+                # A session reports 'playing' before its worker has loaded the
+                # timeline, so the length arriving later is a state change too
+                state = (status['file'], status['state'], status['speed'], status['length'])
+                if state != last_state:
+                    last_state = state
+                    self._publish('state', status)
+                elif status['state'] == 'playing':
+                    self._publish('tick', {'position': status['position'], 'progress': status['progress'],
+                                           'length': status['length']})
+            else:
+                last_state = None  # a new subscriber gets the state on connect anyway
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+    def subscribe(self):
+        """
+        Generator of encoded events for one client, starting with the
+        current state; ends when the client goes away (the generator is closed)
+        """
+        self.start()
+        with self._condition:
+            self.subscribers += 1
+            seq = self._seq
+        try:
+            yield encode_event('state', self.status())
+            while True:
+                with self._condition:
+                    self._condition.wait_for(lambda: self._seq > seq, timeout=self.keepalive)
+                    pending = [event for event_seq, event in self._recent if event_seq > seq]
+                    if self._recent and self._recent[0][0] > seq + 1 and self._state_event:
+                        pending.insert(0, self._state_event)  # missed events: resync first
+                    seq = self._seq
+                if not pending:
+                    yield b": keepalive\n\n"
+                for event in pending:
+                    yield event
+        finally:
+            with self._condition:
+                self.subscribers -= 1
+
+
+if __name__ == "__main__":
+    # Fan one fake playback out to many in-process subscribers and count the broadcaster's work
+    import sys
+
+    clients = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    started = time.perf_counter()
+
+    def fake_status():
+        position = time.perf_counter() - started
+        return {'file': "demo.mid", 'state': 'playing', 'position': position, 'length': 60.0,
+                'progress': position / 60.0, 'speed': 1.0}
+
+    broadcaster = PlaybackBroadcaster(fake_status, interval=0.05)
+    received = [0] * clients
+
+    def client(i):
+        for _ in broadcaster.subscribe():
+            received[i] += 1
+
+    for i in range(clients):
+        threading.Thread(target=client, args=(i,), daemon=True).start()
+    time.sleep(2.0)
+    print(f"{clients} subscribers: {broadcaster.published} events published, "
+          f"{min(received)}-{max(received)} received per subscriber")
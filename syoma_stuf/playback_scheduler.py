@@ -0,0 +1,182 @@
+"""
+Playback Scheduler
+Waits for event deadlines on a monotonic clock: sleeps until just before
+the deadline, then spins for the last stretch. A threading.Event wakes it
+immediately on stop, pause or tempo change, and every event's lateness is recorded.
+
+Events are addressed by song position (seconds into the MIDI file). The
+scheduler maps positions to wall-clock deadlines through a rate that can be
+changed while playing: set_rate() re-anchors the mapping at the current
+position, so only the remaining timeline is rescaled. pause() freezes the
+position until resume(); position() is O(1) and safe to poll from any thread
+"""
+import math
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+import metrics
+
+
+class PlaybackScheduler:
+    """Deadline scheduler for one playback, measured from start()"""
+
+    def __init__(self, spin_seconds=0.002, history=100000, rate=1.0, position=0.0):
+        self.spin_seconds = spin_seconds  # busy-wait this close to a deadline
+        self.wake_event = threading.Event()
+        self.stopped = False
+        self.paused = False
+        self.lateness = deque(maxlen=history)  # seconds each event fired after its deadline
+        self.origin = time.perf_counter()
+        self.rate = rate  # song seconds per playback second
+        self.rate_changes = 0
+        self._anchor_time = 0.0      # now() at the last (re)anchor
+        self._anchor_position = position  # song position at the last (re)anchor
+        self._started = False
+        self._mapping_lock = threading.Lock()
+
+    def start(self, position=0.0):
+        """Make now() count from zero, with the song at position"""
+        with self._mapping_lock:
+            self.origin = time.perf_counter()
+            self._anchor_time = 0.0
+            self._anchor_position = position
+            self._started = True
+
+    def now(self):
+        """Seconds since start() on the monotonic clock"""
+        return time.perf_counter() - self.origin
+
+    def position(self):
+        """Current song position in seconds; frozen before start(), while paused and after stop"""
+        with self._mapping_lock:
+            if self._frozen():
+                return self._anchor_position
+            return self._anchor_position + (self.now() - self._anchor_time) * self.rate
+
+    def deadline_for(self, position):
+        """now() value at which the song reaches position at the current rate (inf while paused)"""
+        with self._mapping_lock:
+            if self.paused:
+                return math.inf
+            return self._anchor_time + (position - self._anchor_position) / self.rate
+
+    def _frozen(self):
+        return self.paused or self.stopped or not self._started
+
+    def _reanchor(self):
+        """Move the anchor to now, keeping the position (caller holds _mapping_lock)"""
+        now = self.now()
+        if not self._frozen():
+            self._anchor_position += (now - self._anchor_time) * self.rate
+        self._anchor_time = now
+
+    def set_rate(self, rate):
+        """Change the playback rate from the current position on, waking any wait to re-plan"""
+        with self._mapping_lock:
+            self._reanchor()
+            self.rate = rate
+            self.rate_changes += 1
+        self.wake_event.set()
+
+    def pause(self):
+        """Freeze the position; waits block until resume()"""
+        with self._mapping_lock:
+            if self.paused:
+                return
+            self._reanchor()
+            self.paused = True
+        self.wake_event.set()
+
+    def resume(self):
+        """Continue from the position pause() froze"""
+        with self._mapping_lock:
+            if not self.paused:
+                return
+            self._reanchor()
+            self.paused = False
+        self.wake_event.set()
+
+    def wait_until(self, deadline):
+        """
+        Block until now() reaches deadline
+
+        Returns:
+            True when the deadline was reached, False if woken by wake() or set_rate()
+        """
+        while not self.wake_event.is_set():
+            remaining = deadline - self.now()
+            if remaining <= 0:
+                return True
+            if math.isinf(remaining):
+                self.wake_event.wait()
+            elif remaining > self.spin_seconds:
+                self.wake_event.wait(remaining - self.spin_seconds)
+        return False
+
+    def wait_for(self, position, offset=0.0):
+        """
+        Block until offset seconds from when the song reaches position,
+        following any rate changes made while waiting and holding while paused
+
+        Returns:
+            True when reached, False if stopped
+        """
+        while True:
+            if self.wait_until(self.deadline_for(position) + offset):
+                return True
+            if self.stopped:
+                return False
+            self.wake_event.clear()
+            if self.stopped:  # stop raced with the clear
+                return False
+
+    def sleep(self, seconds):
+        """
+        Sleep that ends early on stop (but not on rate changes)
+
+        Returns:
+            True if stopped, like Event.wait()
+        """
+        deadline = self.now() + seconds
+        while not self.wait_until(deadline):
+            if self.stopped:
+                return True
+            self.wake_event.clear()
+            if self.stopped:
+                return True
+        return self.stopped
+
+    def wake(self):
+        """Stop: freeze the position and interrupt any wait for good"""
+        with self._mapping_lock:
+            self._reanchor()
+            self.stopped = True
+        self.wake_event.set()
+
+    def record(self, position, offset=0.0):
+        """Record how late an event fired relative to its deadline"""
+        deadline = self.deadline_for(position)
+        if not math.isinf(deadline):  # paused just after firing: no deadline to compare with
+            lateness = self.now() - (deadline + offset)
+            self.lateness.append(lateness)
+            metrics.scheduler_lateness_seconds.observe(lateness)
+
+    def lateness_stats(self):
+        """
+        Scheduling error over the recorded events
+
+        Returns:
+            Dict with the event count and p50/p99/max lateness in milliseconds
+        """
+        if not self.lateness:
+            return {'events': 0, 'p50_ms': 0.0, 'p99_ms': 0.0, 'max_ms': 0.0}
+        lateness_ms = 1000.0 * np.array(self.lateness)
+        return {
+            'events': len(lateness_ms),
+            'p50_ms': float(np.percentile(lateness_ms, 50)),
+            'p99_ms': float(np.percentile(lateness_ms, 99)),
+            'max_ms': float(lateness_ms.max()),
+        }
@@ -0,0 +1,86 @@
+"""
+Batch MIDI Renderer
+Renders every MIDI file in a folder to audio faster than real time,
+spreading the files across a process pool
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+from play_midi import render_midi
+
+DEFAULT_MIDI_FOLDER = Path(__file__).parent.parent / "assets" / "midi_datatbase"
+
+
+def _render_one(midi_file, output_path, sample_rate, sampler):
+    """Process pool worker: render a single file, returning stats or the error"""
+    try:
+        return render_midi(midi_file, output_path, sample_rate=sample_rate, sampler=sampler)
+    except Exception as e:
+        return {'file': str(midi_file), 'error': str(e)}
+
+
+def render_library(midi_folder, output_folder, audio_format="wav", workers=None,
+                   sample_rate=44100, sampler=False):
+    """
+    Render every .mid file in midi_folder into output_folder
+
+    Returns:
+        List of per-file result dicts (see play_midi.render_midi)
+    """
+    midi_files = sorted(Path(midi_folder).glob("*.mid"))
+    if not midi_files:
+        print(f"❌ No MIDI files found in {midi_folder}")
+        return []
+
+    output_folder = Path(output_folder)
+    workers = workers or os.cpu_count()
+    print(f"🎹 Rendering {len(midi_files)} files with {workers} workers → {output_folder}")
+
+    results = []
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(_render_one, str(midi_file),
+                        str(output_folder / f"{midi_file.stem}.{audio_format}"),
+                        sample_rate, sampler)
+            for midi_file in midi_files
+        ]
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            name = Path(result['file']).name
+            if 'error' in result:
+                print(f"  ❌ {name}: {result['error']}")
+            else:
+                print(f"  ✅ {name}: {result['duration_s']:.1f}s audio in "
+                      f"{result['render_s']:.2f}s ({result['realtime_factor']:.0f}x real time)")
+
+    wall = time.perf_counter() - started
+    audio_seconds = sum(r.get('duration_s', 0.0) for r in results)
+    failed = sum(1 for r in results if 'error' in r)
+    print(f"✅ Rendered {audio_seconds:.1f}s of audio in {wall:.2f}s "
+          f"({audio_seconds / wall:.0f}x real time overall), {failed} failed")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render a folder of MIDI files to audio")
+    parser.add_argument("midi_folder", nargs="?", default=str(DEFAULT_MIDI_FOLDER))
+    parser.add_argument("--out", default="renders", help="output folder")
+    parser.add_argument("--format", choices=["wav", "raw"], default="wav",
+                        help="16-bit WAV or raw float32 PCM")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--sample-rate", type=int, default=44100)
+    parser.add_argument("--sampler", action="store_true",
+                        help="render with cached pre-rendered tones")
+    args = parser.parse_args()
+
+    render_library(args.midi_folder, args.out, args.format, args.workers,
+                   args.sample_rate, args.sampler)
+
+
+if __name__ == "__main__":
+    main()
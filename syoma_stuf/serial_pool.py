@@ -0,0 +1,112 @@
+"""
+Serial Connection Pool
+Keeps one open serial handle per (port, baud) for the life of the process,
+so playback sessions start streaming without the Arduino reset delay.
+Handles are health-checked before use and reopened if the device dropped.
+An optional handshake runs once per fresh connection (e.g. protocol negotiation)
+"""
+import threading
+import time
+
+import serial
+
+import metrics
+
+
+class SerialPool:
+    """Shared, health-checked serial connections keyed by (port, baud)"""
+
+    def __init__(self, reset_delay=2.0, handshake=None):
+        self.reset_delay = reset_delay  # the Arduino reboots whenever the port opens
+        self.handshake = handshake  # called with each new handle once the device is up
+        self.handshakes = {}  # (port, baud) -> result of handshake for the current handle
+        self._connections = {}  # (port, baud) -> serial handle
+        self._locks = {}  # (port, baud) -> lock serialising opens
+        self._pool_lock = threading.Lock()
+        self.opens = 0
+        self.reconnects = 0
+
+    def _lock_for(self, key):
+        with self._pool_lock:
+            return self._locks.setdefault(key, threading.Lock())
+
+    def get(self, port, baud, wait=time.sleep):
+        """
+        Return an open handle for (port, baud), opening one if needed
+
+        Args:
+            wait: Called with the reset delay after a fresh open; pass an
+                  Event's wait() to make the delay interruptible
+
+        Raises:
+            serial.SerialException / OSError if the port cannot be opened
+        """
+        key = (port, baud)
+        with self._lock_for(key):
+            ser = self._connections.get(key)
+            fresh = ser is None or not self._healthy(ser)
+            if fresh:
+                if ser is not None:
+                    print(f"[Serial] {port} dropped, reconnecting...")
+                    self.reconnects += 1
+                    self._close(ser)
+                print(f"Opening serial port {port} @ {baud}")
+                self.handshakes.pop(key, None)
+                ser = serial.Serial(port, baud, timeout=0.1)
+                self.opens += 1
+                self._connections[key] = ser
+        if fresh and wait(self.reset_delay):
+            return ser  # interrupted while the device boots; handshake on the next get()
+        if self.handshake is not None and key not in self.handshakes:
+            with self._lock_for(key):
+                if key not in self.handshakes:
+                    self.handshakes[key] = self.handshake(ser)
+        return ser
+
+    def write(self, port, baud, data):
+        """Write to (port, baud), reconnecting once if the device has gone away"""
+        ser = self._connections.get((port, baud))
+        try:
+            if ser is None:
+                raise serial.SerialException(f"{port} is not open")
+            with metrics.serial_write_seconds.time():
+                return ser.write(data)
+        except (serial.SerialException, OSError) as e:
+            print(f"[Serial write error] {e}, reconnecting...")
+            self.reconnects += 1
+            self.discard(port, baud)
+            return self.get(port, baud).write(data)
+
+    def discard(self, port, baud):
+        """Close and forget the handle for (port, baud)"""
+        key = (port, baud)
+        with self._lock_for(key):
+            ser = self._connections.pop(key, None)
+            self.handshakes.pop(key, None)
+        if ser is not None:
+            self._close(ser)
+
+    def close_all(self):
+        """Close every pooled connection"""
+        with self._pool_lock:
+            keys = list(self._connections)
+        for port, baud in keys:
+            self.discard(port, baud)
+
+    @staticmethod
+    def _healthy(ser):
+        """Cheap liveness probe: the handle is open and the OS still sees the device"""
+        try:
+            if not getattr(ser, 'is_open', True):
+                return False
+            getattr(ser, 'in_waiting', 0)
+            return True
+        except (serial.SerialException, OSError):
+            return False
+
+    @staticmethod
+    def _close(ser):
+        try:
+            ser.close()
+        except Exception as e:
+            print(f"[Serial close error] {e}")
@@ -0,0 +1,333 @@
+"""
+Song Library Index
+Persistent SQLite index of a MIDI folder: title, path, duration, note count,
+tempo and track count are extracted once at ingest, so listing, paging and
+prefix/full-text queries never touch the filesystem or mido at request time.
+
+Titles are searchable through an FTS5 table when the sqlite3 build has it
+(plain LIKE matching otherwise). sync() only parses files that are new or
+changed since the last sync, keyed by size and mtime; files that failed to
+parse are remembered the same way, so they are not retried until they change.
+
+The database lives in the MIDI folder unless SONG_LIBRARY_DB names another
+file (for a read-only or network music folder)
+"""
+import os
+import sqlite3
+import threading
+from pathlib import Path
+
+from song_search import MIDI_FOLDER, normalize_string
+
+DB_NAME = ".song_library.sqlite"
+DB_PATH_ENV = "SONG_LIBRARY_DB"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS songs (
+    id INTEGER PRIMARY KEY,
+    filename TEXT NOT NULL UNIQUE,
+    title TEXT NOT NULL,
+    title_norm TEXT NOT NULL,
+    path TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    duration REAL,
+    note_count INTEGER,
+    tempo_bpm REAL,
+    track_count INTEGER
+);
+CREATE INDEX IF NOT EXISTS songs_title_norm ON songs (title_norm);
+CREATE TABLE IF NOT EXISTS failed (
+    filename TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    error TEXT NOT NULL
+);
+"""
+
+# External-content FTS table kept in step with songs by triggers
+_FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS songs_fts USING fts5(
+    title_norm, content='songs', content_rowid='id', prefix='2 3'
+);
+CREATE TRIGGER IF NOT EXISTS songs_ai AFTER INSERT ON songs BEGIN
+    INSERT INTO songs_fts (rowid, title_norm) VALUES (new.id, new.title_norm);
+END;
+CREATE TRIGGER IF NOT EXISTS songs_ad AFTER DELETE ON songs BEGIN
+    INSERT INTO songs_fts (songs_fts, rowid, title_norm) VALUES ('delete', old.id, old.title_norm);
+END;
+CREATE TRIGGER IF NOT EXISTS songs_au AFTER UPDATE ON songs BEGIN
+    INSERT INTO songs_fts (songs_fts, rowid, title_norm) VALUES ('delete', old.id, old.title_norm);
+    INSERT INTO songs_fts (rowid, title_norm) VALUES (new.id, new.title_norm);
+END;
+"""
+
+_COLUMNS = "filename, title, path, duration, note_count, tempo_bpm, track_count"
+
+
+def extract_metadata(midi_file, mid=None):
+    """
+    Read the metadata stored in the library from one MIDI file
+
+    Args:
+        mid: Already parsed mido.MidiFile, to skip parsing the file again
+
+    Returns:
+        Dict with duration (s), note_count, tempo_bpm (first tempo, 120 if
+        none is set) and track_count
+    """
+    import mido
+
+    if mid is None:
+        mid = mido.MidiFile(midi_file)
+    note_count = 0
+    tempo = None
+    for track in mid.tracks:
+        for msg in track:
+            if msg.type == 'note_on' and msg.velocity > 0:
+                note_count += 1
+            elif msg.type == 'set_tempo' and tempo is None:
+                tempo = msg.tempo
+    return {
+        'duration': float(mid.length),
+        'note_count': note_count,
+        'tempo_bpm': float(mido.tempo2bpm(tempo if tempo is not None else 500000)),
+        'track_count': len(mid.tracks),
+    }
+
+
+class SongLibrary:
+    """SQLite index of the .mid files in one folder"""
+
+    def __init__(self, folder, db_path=None):
+        self.folder = Path(folder).resolve()
+        self.db_path = Path(db_path) if db_path else self.folder / DB_NAME
+        self._lock = threading.Lock()  # one connection, shared by the server's threads
+        self._sync_lock = threading.Lock()
+        self._db = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        with self._lock, self._db:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.executescript(_SCHEMA)
+            try:
+                self._db.executescript(_FTS_SCHEMA)
+                self.fts = True
+            except sqlite3.OperationalError:  # sqlite3 built without FTS5
+                self.fts = False
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def scan(self):
+        """
+        Compare the folder with the index
+
+        Returns:
+            (stats of the .mid files on disk that are new or changed since
+            they were indexed or failed, filenames indexed or failed but no
+            longer on disk); None if the folder cannot be read
+        """
+        with self._lock:
+            known = {row['filename']: (row['size'], row['mtime_ns'])
+                     for row in self._db.execute("SELECT filename, size, mtime_ns FROM songs"
+                                                 " UNION ALL SELECT filename, size, mtime_ns FROM failed")}
+        try:
+            with os.scandir(self.folder) as entries:
+                on_disk = {entry.name: entry.stat() for entry in entries
+                           if entry.name.endswith('.mid') and entry.is_file()}
+        except OSError as e:
+            print(f"[Song library] Could not scan {self.folder}: {e}")
+            return None
+        changed = {filename: stat for filename, stat in on_disk.items()
+                   if known.get(filename) != (stat.st_size, stat.st_mtime_ns)}
+        removed = [filename for filename in known if filename not in on_disk]
+        return changed, removed
+
+    def store(self, entries):
+        """
+        Add or update songs
+
+        Args:
+            entries: (filename, os.stat_result, metadata dict from extract_metadata)
+
+        Returns:
+            Number of songs that were already indexed (updated rather than added)
+        """
+        rows = []
+        for filename, stat, metadata in entries:
+            title = filename[:-len('.mid')]
+            rows.append((filename, title, normalize_string(title), str(self.folder / filename),
+                         stat.st_size, stat.st_mtime_ns, metadata['duration'],
+                         metadata['note_count'], metadata['tempo_bpm'], metadata['track_count']))
+        with self._lock, self._db:
+            updated = sum(self._db.execute("SELECT COUNT(*) FROM songs WHERE filename = ?",
+                                           (row[0],)).fetchone()[0] for row in rows)
+            self._db.executemany(
+                "INSERT INTO songs (filename, title, title_norm, path, size, mtime_ns, duration,"
+                " note_count, tempo_bpm, track_count) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+                " ON CONFLICT (filename) DO UPDATE SET title = excluded.title,"
+                " title_norm = excluded.title_norm, path = excluded.path, size = excluded.size,"
+                " mtime_ns = excluded.mtime_ns, duration = excluded.duration,"
+                " note_count = excluded.note_count, tempo_bpm = excluded.tempo_bpm,"
+                " track_count = excluded.track_count", rows)
+            self._db.executemany("DELETE FROM failed WHERE filename = ?", [(row[0],) for row in rows])
+        return updated
+
+    def mark_failed(self, entries):
+        """
+        Remember files that could not be parsed, so scan() leaves them out
+        until they change
+
+        Args:
+            entries: (filename, os.stat_result, error message)
+        """
+        rows = [(filename, stat.st_size, stat.st_mtime_ns, error) for filename, stat, error in entries]
+        with self._lock, self._db:
+            self._db.executemany("DELETE FROM songs WHERE filename = ?", [(row[0],) for row in rows])
+            self._db.executemany("INSERT OR REPLACE INTO failed (filename, size, mtime_ns, error)"
+                                 " VALUES (?, ?, ?, ?)", rows)
+
+    def remove(self, filenames):
+        """Drop songs (and failed files) from the index"""
+        rows = [(filename,) for filename in filenames]
+        with self._lock, self._db:
+            self._db.executemany("DELETE FROM songs WHERE filename = ?", rows)
+            self._db.executemany("DELETE FROM failed WHERE filename = ?", rows)
+
+    def sync(self):
+        """
+        Bring the index up to date with the folder, parsing only new or changed
+        files in this process (see ingest_library.py for a parallel version)
+
+        Returns:
+            Dict with the number of files added, updated, removed and failed
+        """
+        with self._sync_lock:
+            scanned = self.scan()
+            if scanned is None:
+                return {'added': 0, 'updated': 0, 'removed': 0, 'failed': 0}
+            changed, removed = scanned
+
+            # Parse outside the database lock so queries keep being served
+            entries = []
+            failures = []
+            for filename, stat in changed.items():
+                try:
+                    entries.append((filename, stat, extract_metadata(self.folder / filename)))
+                except Exception as e:
+                    print(f"[Song library] Skipping {filename}: {e}")
+                    failures.append((filename, stat, f"{type(e).__name__}: {e}"))
+
+            self.remove(removed)
+            updated = self.store(entries)
+            self.mark_failed(failures)
+            return {'added': len(entries) - updated, 'updated': updated,
+                    'removed': len(removed), 'failed': len(failures)}
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            return [dict(row) for row in self._db.execute(sql, params)]
+
+    def count(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM songs").fetchone()[0]
+
+    def get(self, filename):
+        """One song's row, or None"""
+        rows = self._query(f"SELECT {_COLUMNS} FROM songs WHERE filename = ?", (filename,))
+        return rows[0] if rows else None
+
+    def page(self, offset=0, limit=50):
+        """Songs sorted by title, limit at a time"""
+        return self._query(f"SELECT {_COLUMNS} FROM songs ORDER BY title_norm, filename"
+                           " LIMIT ? OFFSET ?", (limit, offset))
+
+    def prefix(self, text, limit=10):
+        """Songs whose (normalized) title starts with text, for autocomplete"""
+        start = normalize_string(text)
+        # Range scan on the title index: start <= title_norm < start + highest character
+        return self._query(f"SELECT {_COLUMNS} FROM songs WHERE title_norm >= ? AND title_norm < ?"
+                           " ORDER BY title_norm, filename LIMIT ?", (start, start + '\uffff', limit))
+
+    def search(self, text, limit=10):
+        """
+        Songs containing every word of text (each word may be the start of a
+        title word), best matches first
+        """
+        words = normalize_string(text).split()
+        if not words:
+            return []
+        if self.fts:
+            match = " ".join(f'"{word}"*' for word in words)
+            return self._query(f"SELECT {_COLUMNS} FROM songs_fts JOIN songs ON songs.id = songs_fts.rowid"
+                               " WHERE songs_fts MATCH ? ORDER BY rank LIMIT ?", (match, limit))
+        where = " AND ".join("title_norm LIKE ?" for _ in words)
+        return self._query(f"SELECT {_COLUMNS} FROM songs WHERE {where} ORDER BY title_norm LIMIT ?",
+                           [f"%{word}%" for word in words] + [limit])
+
+    def suggest(self, text, limit=5):
+        """
+        Titles worth offering when text matched no song: full-text matches
+        first, then songs sharing any one word, then the first titles
+        alphabetically
+        """
+        titles = [row['title'] for row in self.search(text, limit)]
+        for word in normalize_string(text).split():
+            if len(titles) >= limit:
+                break
+            titles += [row['title'] for row in self.search(word, limit) if row['title'] not in titles]
+        if len(titles) < limit:
+            titles += [row['title'] for row in self.page(0, limit) if row['title'] not in titles]
+        return titles[:limit]
+
+
+_library = None
+_library_lock = threading.Lock()
+
+
+def get_library():
+    """
+    The shared SongLibrary for song_search.MIDI_FOLDER, opened on first use (no sync)
+
+    Raises:
+        sqlite3.Error if the database cannot be opened (e.g. the folder is
+        missing or read-only and SONG_LIBRARY_DB is not set)
+    """
+    global _library
+    import song_search
+    with _library_lock:
+        if _library is None or _library.folder != Path(song_search.MIDI_FOLDER).resolve():
+            _library = SongLibrary(song_search.MIDI_FOLDER, os.getenv(DB_PATH_ENV))
+        return _library
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="Build or query the song library index")
+    parser.add_argument("folder", nargs="?", default=MIDI_FOLDER)
+    parser.add_argument("--search", help="full-text search titles")
+    parser.add_argument("--prefix", help="titles starting with this")
+    parser.add_argument("--page", type=int, help="list this page of 20 songs")
+    parser.add_argument("--db", default=os.getenv(DB_PATH_ENV),
+                        help=f"database file (default: {DB_NAME} in the folder)")
+    args = parser.parse_args()
+
+    library = SongLibrary(args.folder, args.db)
+    start = time.perf_counter()
+    changes = library.sync()
+    print(f"📚 {library.count()} songs indexed in {library.db_path} "
+          f"({changes} in {time.perf_counter() - start:.2f}s, FTS5: {library.fts})")
+    if args.search:
+        rows = library.search(args.search)
+    elif args.prefix:
+        rows = library.prefix(args.prefix)
+    elif args.page is not None:
+        rows = library.page(offset=20 * args.page, limit=20)
+    else:
+        rows = []
+    for row in rows:
+        print(f"  {row['title']}: {row['duration']:.1f}s, {row['note_count']} notes, "
+              f"{row['tempo_bpm']:.0f} BPM, {row['track_count']} tracks")
@@ -1,16 +1,42 @@
 """
 Song Search Module
 Efficiently searches for MIDI files with lenient fuzzy matching
-Works well for large datasets
+Works well for large datasets: the folder is cataloged once (SongCatalog)
+and only rescanned when its contents change, and each query fully scores
+names in order of an upper bound on their score, stopping once no remaining
+name can beat the results so far (the same ranking as scoring every name)
 """
+import heapq
 import os
+import re
+import threading
+import time
 from pathlib import Path
 from difflib import SequenceMatcher
-import re
+
+import numpy as np
+
+import metrics
 
 # MIDI folder location
 MIDI_FOLDER = r"C:\Users\semyo\OneDrive\Documents\GitHub\piano-warlock\assets\midi_datatbase"
 
+_MID_SUFFIX = re.compile(r'\.mid$')
+_NON_ALNUM = re.compile(r'[^a-z0-9\s]')
+_SPACES = re.compile(r'\s+')
+
+# Names probed first for an early score floor (see _SearchIndex.candidates),
+# about this many, picked by the bound of every PROBE_SAMPLE-th name
+PROBE_SIZE = 2048
+PROBE_SAMPLE = 8
+# Normalized names only use these characters (see normalize_string)
+_ALPHABET = "abcdefghijklmnopqrstuvwxyz0123456789 "
+_CHAR_CODES = np.full(256, len(_ALPHABET), dtype=np.intp)  # anything else shares the last code
+_CHAR_CODES[np.frombuffer(_ALPHABET.encode(), dtype=np.uint8)] = np.arange(len(_ALPHABET))
+# Name characters tracked by the bit-parallel LCS (one uint64 per name)
+_NAME_BITS = 64
+_ALL_BITS = np.iinfo(np.uint64).max
+
 def normalize_string(s):
     """
     Normalize a string for comparison by:
@@ -21,13 +47,13 @@ def normalize_string(s):
     # Convert to lowercase
     s = s.lower()
     # Remove file extension if present
-    s = re.sub(r'\.mid$', '', s)
+    s = _MID_SUFFIX.sub('', s)
     # Replace underscores and dashes with spaces
     s = s.replace('_', ' ').replace('-', ' ')
     # Remove special characters but keep spaces
-    s = re.sub(r'[^a-z0-9\s]', '', s)
+    s = _NON_ALNUM.sub('', s)
     # Collapse multiple spaces into one
-    s = re.sub(r'\s+', ' ', s)
+    s = _SPACES.sub(' ', s)
     # Strip leading/trailing spaces
     return s.strip()
 
@@ -40,7 +66,16 @@ def similarity_score(query, filename):
     """
     query_norm = normalize_string(query)
     filename_norm = normalize_string(filename)
-    
+    return _normalized_score(query_norm, query_norm.split(), filename_norm, filename_norm.split())
+
+def _normalized_score(query_norm, query_words, filename_norm, filename_words, floor=0.0):
+    """
+    similarity_score on strings that are already normalized and split into words
+
+    Scores below floor are uninteresting to the caller, so the SequenceMatcher
+    ratio is skipped when its upper bound shows it cannot matter; the score
+    returned then is exact whenever it is at least floor
+    """
     # Strategy 1: Exact match after normalization
     if query_norm == filename_norm:
         return 1.0
@@ -50,9 +85,6 @@ def similarity_score(query, filename):
         return 0.95
     
     # Strategy 3: All words in query appear in filename
-    query_words = query_norm.split()
-    filename_words = filename_norm.split()
-    
     if query_words and all(any(qw in fw for fw in filename_words) for qw in query_words):
         return 0.9
     
@@ -60,19 +92,507 @@ def similarity_score(query, filename):
     if query_words and all(any(fw.startswith(qw) for fw in filename_words) for qw in query_words):
         return 0.85
     
-    # Strategy 5: Sequence matching (SequenceMatcher ratio)
-    # This is efficient even for large datasets
-    ratio = SequenceMatcher(None, query_norm, filename_norm).ratio()
-    
     # Strategy 6: Word-level matching
     # Count how many words match
+    word_score = 0.0
     if query_words and filename_words:
         matching_words = sum(1 for qw in query_words if any(qw in fw or fw in qw for fw in filename_words))
-        word_ratio = matching_words / len(query_words)
-        # Combine with sequence ratio
-        return max(ratio, word_ratio * 0.8)
+        word_score = matching_words / len(query_words) * 0.8
     
-    return ratio
+    # Strategy 5: Sequence matching (SequenceMatcher ratio), combined with the word score
+    # Length-only bound first (SequenceMatcher.real_quick_ratio, without building the matcher)
+    bound = 2.0 * min(len(query_norm), len(filename_norm)) / (len(query_norm) + len(filename_norm))
+    if bound <= word_score or bound < floor:
+        return word_score
+    matcher = SequenceMatcher(None, query_norm, filename_norm)
+    bound = matcher.quick_ratio()
+    if bound <= word_score or bound < floor:
+        return word_score
+    return max(matcher.ratio(), word_score)
+
+def _char_codes(string):
+    """Code of each character of a normalized string (its index in _ALPHABET)"""
+    return _CHAR_CODES[np.frombuffer(string.encode('ascii', 'replace'), dtype=np.uint8)]
+
+def _char_tables(strings):
+    """
+    Per-string character tables, as (character code, string) arrays: how
+    often each character occurs in the first and in the second half of the
+    string (filenames of at most 255 characters fit uint8) and the bit set of
+    its positions among the first _NAME_BITS characters
+    """
+    count = len(strings)
+    lengths = np.fromiter((len(s) for s in strings), dtype=np.int64, count=count)
+    codes = _char_codes("".join(strings))
+    owners = np.repeat(np.arange(count, dtype=np.intp), lengths)
+    positions = np.arange(len(codes)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    cells = codes * count + owners
+    rows = len(_ALPHABET) + 1
+    first = positions < np.repeat(lengths // 2, lengths)
+    halves = [np.bincount(cells[half], minlength=rows * count).astype(np.uint8).reshape(rows, count)
+              for half in (first, ~first)]
+    tracked = positions < _NAME_BITS
+    bits = np.zeros(rows * count, dtype=np.uint64)
+    np.bitwise_or.at(bits, cells[tracked], np.left_shift(np.uint64(1), positions[tracked].astype(np.uint64)))
+    return halves, bits.reshape(rows, count), lengths
+
+def _popcount(values):
+    """Set bits in each uint64 (np.bitwise_count needs NumPy 2)"""
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(values).astype(np.int64)
+    return np.unpackbits(values.view(np.uint8)).reshape(len(values), -1).sum(axis=1, dtype=np.int64)
+
+def _substrings(word, max_len=None):
+    """Distinct substrings of word, up to max_len letters long"""
+    max_len = max_len or len(word)
+    return {word[i:j] for i in range(len(word)) for j in range(i + 1, min(i + max_len, len(word)) + 1)}
+
+class _Postings:
+    """
+    Inverted index from term id to the positions of the songs containing it,
+    stored as CSR arrays (offsets into one postings array)
+    """
+
+    def __init__(self, term_ids, vocabulary_size):
+        self.sizes = np.fromiter((len(ids) for ids in term_ids), dtype=np.int64, count=len(term_ids))
+        flat = np.concatenate(term_ids) if term_ids else np.zeros(0, dtype=np.int32)
+        owners = np.repeat(np.arange(len(term_ids), dtype=np.int32), self.sizes)
+        self.postings = owners[np.argsort(flat, kind='stable')]
+        self.offsets = np.zeros(vocabulary_size + 1, dtype=np.int64)
+        np.cumsum(np.bincount(flat, minlength=vocabulary_size), out=self.offsets[1:])
+
+    def gather(self, term_ids):
+        """Positions of the songs containing each term, concatenated (a song repeats per term)"""
+        term_ids = np.asarray(term_ids, dtype=np.int64)
+        term_ids = term_ids[term_ids < len(self.offsets) - 1]  # terms newer than this snapshot
+        starts = self.offsets[term_ids]
+        lengths = self.offsets[term_ids + 1] - starts
+        starts, lengths = starts[lengths > 0], lengths[lengths > 0]
+        if not len(lengths):
+            return np.zeros(0, dtype=np.int32)
+        if len(lengths) <= 64:
+            # Few terms: copying their slices beats indexing every posting
+            return np.concatenate([self.postings[start:start + length]
+                                   for start, length in zip(starts.tolist(), lengths.tolist())])
+        # Index of every posting of every term without a Python loop: step by
+        # one inside a term, jump to the next term's start at each boundary
+        steps = np.ones(int(lengths.sum()), dtype=np.int64)
+        steps[0] = starts[0]
+        steps[np.cumsum(lengths)[:-1]] = starts[1:] - (starts[:-1] + lengths[:-1]) + 1
+        return self.postings[np.cumsum(steps)]
+
+class _SearchIndex:
+    """
+    Immutable snapshot of the catalog for searching: the songs, word
+    postings and per-name character tables. Bounds every song's
+    _normalized_score from above without running SequenceMatcher:
+      - a name containing every query word scores exactly 0.9 unless the
+        whole query is a substring (0.95) or equal to it (1.0), which the
+        character positions show (Shift-And)
+      - any other name scores the larger of the word-level score, which the
+        word postings give exactly, and the SequenceMatcher ratio, whose
+        matching blocks form a common subsequence, so the ratio is at most
+        2 * LCS / total length
+    The LCS is first bounded from the characters shared with each half of
+    the name (_split_common), and computed only for names whose split bound
+    could still make the results
+    """
+
+    def __init__(self, songs, word_vocabulary_size):
+        self.songs = songs  # list of (filename, catalog song tuple)
+        self.words = _Postings([song[4] for _, song in songs], word_vocabulary_size)
+        self.half_counts, self.char_positions, self.lengths = _char_tables([song[1] for _, song in songs])
+        tracked = np.minimum(self.lengths, _NAME_BITS)
+        self.tracked_bits = np.where(tracked > 0, np.right_shift(
+            np.uint64(_ALL_BITS), (_NAME_BITS - tracked).astype(np.uint64)), np.uint64(0))
+        self.long_names = np.flatnonzero(self.lengths > _NAME_BITS)
+
+    def _lcs_bound(self, query_codes, positions, common, word_score, contains_all):
+        """
+        _bound for the songs at positions, refining their split bounds (common)
+        to common subsequences with the query. Only where that can change the
+        bound: not for songs containing every query word (scored by tier), nor
+        where the split bound already leaves the ratio below the word score
+        """
+        lengths = self.lengths[positions]
+        word_score, contains_all = word_score[positions], contains_all[positions]
+        common = common[positions]
+        refine = ~contains_all & (2.0 * common / (len(query_codes) + lengths) > word_score)
+        if refine.any():
+            common[refine] = self._common_subsequences(query_codes, positions[refine])
+        contained = np.zeros(len(positions), dtype=bool)
+        if contains_all.any():
+            contained[contains_all] = self._occurrences(query_codes, positions[contains_all])
+        return self._bound(len(query_codes), common, lengths, word_score, contains_all, contained)
+
+    def _containing(self, word, out):
+        """
+        Mark in out the names with a word containing word, which has no
+        spaces, so is just where it occurs in the name: the character counts
+        for a letter, Shift-And over the tracked characters otherwise (and a
+        plain search in names longer than those)
+        """
+        codes = _char_codes(word)
+        if len(codes) == 1:
+            np.logical_or(self.half_counts[0][codes[0]], self.half_counts[1][codes[0]], out=out)
+            return
+        ends = self.char_positions[codes[0]] << np.uint64(1)
+        for code in codes[1:-1]:
+            ends &= self.char_positions[code]
+            ends <<= np.uint64(1)
+        ends &= self.char_positions[codes[-1]]
+        np.not_equal(ends, 0, out=out)
+        for position in self.long_names.tolist():
+            out[position] = word in self.songs[position][1][1]
+
+    def _occurrences(self, query_codes, positions):
+        """Whether the query occurs in each name at positions (assumed for names over _NAME_BITS characters)"""
+        # Shift-And: bit i is set where a match of the query so far ends at position i
+        ends = self.char_positions[query_codes[0]].take(positions)
+        for code in query_codes[1:]:
+            ends <<= np.uint64(1)
+            ends &= self.char_positions[code].take(positions)
+        return (ends != 0) | (self.lengths[positions] > _NAME_BITS)
+
+    def _common_subsequences(self, query_codes, positions):
+        """
+        Longest common subsequence of the query with the names at positions
+        (an upper bound for names over _NAME_BITS characters); bit-parallel
+        over each name's characters, one vectorized step per query character
+        """
+        # Gathering costs more than the steps, so each distinct character is gathered once
+        query_codes = query_codes.tolist()
+        matches = {code: self.char_positions[code].take(positions) for code in set(query_codes)}
+        rows = np.full(len(positions), _ALL_BITS, dtype=np.uint64)
+        carry = np.empty_like(rows)
+        rest = np.empty_like(rows)
+        for code in query_codes:
+            # Hyyro: U = V & M, V' = (V + U) | (V - U); a zero bit is a matched name position
+            match = matches[code]
+            np.bitwise_and(rows, match, out=carry)
+            np.subtract(rows, carry, out=rest)
+            rows += carry
+            rows |= rest
+        rows &= self.tracked_bits[positions]
+        lengths = self.lengths[positions]
+        return lengths - _popcount(rows)
+
+    def _split_common(self, query_codes):
+        """
+        Upper bound on the longest common subsequence of the query with every
+        name. A common subsequence splits where it crosses the middle of the
+        name, so it is at most the best, over the split points j of the query,
+        of the characters query[:j] shares with the first half of the name
+        plus those query[j:] shares with the second half
+        """
+        first, second = self.half_counts
+        count = len(self.songs)
+        query_codes = query_codes.tolist()
+        # Shared characters are at most the query's length. Comparisons and
+        # adds of small unsigned types are the fastest NumPy gets, so sharing
+        # min(n, r) of a character that occurs r times in the query counts as
+        # the number of t <= r with n >= t (adding the flags as uint8 skips a cast)
+        shared = np.zeros(count, dtype=np.uint8 if len(query_codes) <= 255 else np.uint16)
+        flags = np.empty(count, dtype=bool)
+        right = {}  # occurrences in query[j:]
+        for code in query_codes:
+            right[code] = right.get(code, 0) + 1
+            np.greater_equal(second[code], min(right[code], 255), out=flags)
+            np.add(shared, flags.view(np.uint8), out=shared)
+        best = shared.copy()
+        # Move the split right one query character at a time. That character
+        # is shared with the first half if the half has more of it than
+        # query[:j] has, and was shared with the second half if that has at
+        # least as many as query[j:] has (names of at most 255 characters
+        # hold fewer than 255 of anything per half, hence the clamps)
+        left = dict.fromkeys(right, 0)  # occurrences in query[:j]
+        gained = flags
+        lost = np.empty(count, dtype=bool)
+        for code in query_codes:
+            left[code] += 1
+            np.greater_equal(first[code], min(left[code], 255), out=gained)
+            np.greater_equal(second[code], min(right[code], 255), out=lost)
+            right[code] -= 1
+            np.add(shared, gained.view(np.uint8), out=shared)
+            np.subtract(shared, lost.view(np.uint8), out=shared)
+            np.maximum(best, shared, out=best)
+        return best
+
+    @staticmethod
+    def _bound(query_len, common, lengths, word_score, contains_all, contained):
+        """
+        Score bound from a common subsequence length (or an upper bound of
+        it) and whether the query may be a substring of each name
+        """
+        # Same arithmetic as _normalized_score and difflib, so the bounds are
+        # the very floats those would compute (doubling after dividing rounds
+        # the same). All in one array: fresh ones cost more than the math
+        bound = np.add(lengths, query_len, dtype=np.float64)
+        np.divide(common, bound, out=bound)
+        bound *= 2.0
+        np.maximum(bound, word_score, out=bound)
+        bound[contains_all] = np.where(contained[contains_all], 0.95, 0.9)
+        bound[contains_all & contained & (lengths == query_len)] = 1.0
+        return bound
+
+    def candidates(self, query_norm, query_words, word_matches, min_score, floor):
+        """
+        Songs whose score could make the results, most promising first
+
+        Args:
+            query_norm, query_words: The normalized query and its words
+            word_matches: For each distinct query word, the word, its count in
+                the query, the ids of the name words containing it and of the
+                other name words inside it (see SongCatalog._matching_words)
+            floor: Callable giving the score a song has to beat to change
+                the results, or None while they are not full; read between
+                yields, as the caller scores the songs
+        """
+        count = len(self.songs)
+        # Counts of query words, so small unsigned types do (and add fastest,
+        # the marks too when viewed as uint8 rather than cast)
+        dtype = np.uint8 if len(query_words) <= 255 else np.uint16
+        contains = np.zeros(count, dtype=dtype)
+        words_matched = np.zeros(count, dtype=dtype)
+        marks = np.zeros(count, dtype=bool)
+        for word, repeats, containing, inside in word_matches:
+            weight = dtype(repeats)
+            if containing is None:
+                # Short or common words are in so many names that finding
+                # them in the character tables beats marking that many postings
+                self._containing(word, marks)
+            else:
+                marks[:] = False
+                marks[self.words.gather(containing)] = True
+            contains += marks.view(np.uint8) * weight
+            marks[self.words.gather(inside)] = True
+            words_matched += marks.view(np.uint8) * weight
+        word_score = np.divide(words_matched, len(query_words))
+        word_score *= 0.8
+        contains_all = contains == len(query_words)
+
+        query_codes = _char_codes(query_norm)
+        common = self._split_common(query_codes)
+        bound = self._bound(len(query_norm), common, self.lengths, word_score, contains_all,
+                            common >= len(query_norm))
+
+        # Probe: the best few by the split bound get the LCS bound, and the
+        # most promising of them are scored until the results are full. Then
+        # every other song whose split bound beats the floor this set gets
+        # the LCS bound, and they are all scored best first until the floor
+        # passes them. Positions stay sorted, for cache-friendly gathers
+        eligible = bound >= min_score
+        if np.count_nonzero(eligible) > PROBE_SIZE:
+            # About the best PROBE_SIZE, all eligible as more than that are.
+            # Bounds tie a lot, which makes selecting among all of them slow
+            # (milliseconds), so the cutoff comes from a sample, topped up
+            # with songs right at it
+            rank = PROBE_SIZE // PROBE_SAMPLE
+            cutoff = np.partition(bound[::PROBE_SAMPLE], -rank)[-rank]
+            probe = np.flatnonzero(bound > cutoff)
+            if len(probe) < PROBE_SIZE:
+                at_cutoff = np.flatnonzero(bound == cutoff)[:PROBE_SIZE - len(probe)]
+                probe = np.sort(np.concatenate([probe, at_cutoff]))
+        else:
+            probe = np.flatnonzero(eligible)
+        eligible[probe] = False
+        refined = self._lcs_bound(query_codes, probe, common, word_score, contains_all)
+        order = np.argsort(-refined, kind='stable')
+        scored = 0
+        while scored < len(order) and floor() is None and refined[order[scored]] >= min_score:
+            yield self.songs[probe[order[scored]]]
+            scored += 1
+
+        limit = floor()
+        if limit is not None:
+            eligible &= bound > limit
+        remaining = np.flatnonzero(eligible)
+        positions = np.concatenate([probe[order[scored:]], remaining])
+        refined = np.concatenate([refined[order[scored:]],
+                                  self._lcs_bound(query_codes, remaining, common, word_score, contains_all)])
+        worth = refined > limit if limit is not None else refined >= min_score
+        positions, refined = positions[worth], refined[worth]
+        for i in np.argsort(-refined, kind='stable'):
+            limit = floor()
+            if limit is not None and refined[i] <= limit:
+                break  # nothing else can beat the results (at most tie them)
+            yield self.songs[positions[i]]
+
+class SongCatalog:
+    """
+    The MIDI files of one folder with their normalized names precomputed.
+    The folder is rescanned only when its mtime changes (files added,
+    removed or renamed), checked at most every poll_interval seconds,
+    and only new files are normalized. Lookups never wait for a rescan:
+    a due check runs on a background thread, which builds the new
+    _SearchIndex and then swaps it in, so searches keep using the previous
+    snapshot meanwhile. Searches fully score names in order of the score
+    bounds from _SearchIndex, only as far as needed
+    """
+
+    def __init__(self, folder, poll_interval=2.0):
+        self.folder = Path(folder)
+        self.poll_interval = poll_interval
+        self.exists = False
+        self.refreshes = 0  # rescans that found a change
+        self._songs = {}  # filename -> (stem, normalized name, words, full path, word ids)
+        self._names = []  # sorted stems
+        # The vocabulary only grows, so ids stay valid for older snapshots
+        self._words = {}  # name word -> id
+        self._word_list = []  # id -> name word
+        self._word_trigrams = {}  # three letters -> ids of the name words containing them
+        self._index = _SearchIndex([], 0)
+        self._folder_mtime = None
+        self._next_check = 0.0
+        self._lock = threading.Lock()  # serializes rescans; lookups never take it
+        self._refresher = None  # background rescan thread
+        self._refresher_lock = threading.Lock()
+        self.refresh(force=True)
+
+    def refresh(self, force=False):
+        """
+        Bring the catalog up to date with the folder, on the calling thread
+        (lookups call _maybe_refresh instead)
+
+        Returns:
+            True if songs were added or removed
+        """
+        with self._lock:
+            self._next_check = time.monotonic() + self.poll_interval
+            try:
+                mtime = self.folder.stat().st_mtime_ns
+            except OSError:
+                self.exists = False
+                changed = bool(self._songs)
+                self._songs, self._names, self._folder_mtime = {}, [], None
+                self._index = _SearchIndex([], 0)
+                return changed
+            self.exists = True
+            if mtime == self._folder_mtime and not force:
+                return False
+
+            self._folder_mtime = mtime
+            with os.scandir(self.folder) as entries:
+                filenames = {entry.name for entry in entries
+                             if entry.name.endswith('.mid') and entry.is_file()}
+            if filenames == self._songs.keys():
+                return False
+
+            # Copy on write: searches running on the old dict are unaffected
+            songs = {name: song for name, song in self._songs.items() if name in filenames}
+            for name in filenames - songs.keys():
+                stem = name[:-len('.mid')]
+                normalized = normalize_string(stem)
+                words = normalized.split()
+                songs[name] = (stem, normalized, words, str(self.folder / name), self._add_words(words))
+            # Build everything first, then swap: lookups read the attributes without the lock
+            index = _SearchIndex(list(songs.items()), len(self._words))
+            names = sorted(song[0] for song in songs.values())
+            self._index, self._songs, self._names = index, songs, names
+            self.refreshes += 1
+            return True
+
+    def _add_words(self, words):
+        """Ids of a name's distinct words, adding new words to the vocabulary"""
+        ids = []
+        for word in set(words):
+            word_id = self._words.get(word)
+            if word_id is None:
+                word_id = self._words[word] = len(self._word_list)
+                self._word_list.append(word)
+                for trigram in {word[i:i + 3] for i in range(len(word) - 2)}:
+                    self._word_trigrams.setdefault(trigram, []).append(word_id)
+            ids.append(word_id)
+        return np.array(ids, dtype=np.int32)
+
+    def _matching_words(self, query_word):
+        """
+        Returns:
+            Ids of the name words w with query_word in w (None for short or
+            common words, which _SearchIndex.candidates finds from the
+            character tables), and of the other words with w in query_word
+        """
+        containing = None
+        if len(query_word) > 3:
+            # Words containing the query word contain all of its trigrams,
+            # each listed once per trigram, so the ids are distinct
+            shortest = min((self._word_trigrams.get(query_word[i:i + 3], ())
+                            for i in range(len(query_word) - 2)), key=len)
+            # Checking each of that many words costs more than the tables
+            if len(shortest) * 100 <= len(self._songs):
+                word_list = self._word_list
+                containing = np.array([w for w in shortest if query_word in word_list[w]], dtype=np.int64)
+        inside = [self._words[sub] for sub in _substrings(query_word) if sub in self._words and sub != query_word]
+        return containing, np.array(inside, dtype=np.int64)
+
+    def _maybe_refresh(self):
+        """Start a background rescan if a check is due; never waits for it"""
+        if time.monotonic() < self._next_check:
+            return
+        with self._refresher_lock:
+            if time.monotonic() < self._next_check or (self._refresher and self._refresher.is_alive()):
+                return
+            self._next_check = time.monotonic() + self.poll_interval
+            self._refresher = threading.Thread(target=self._background_refresh, daemon=True)
+            self._refresher.start()
+
+    def _background_refresh(self):
+        try:
+            self.refresh()
+        except OSError as e:  # e.g. the folder vanished between stat and scandir
+            print(f"⚠️ Could not rescan {self.folder}: {e}")
+
+    def __len__(self):
+        self._maybe_refresh()
+        return len(self._songs)
+
+    def search(self, query, top_n=5, min_score=0.3, exhaustive=False):
+        """
+        Same as search_song, over this catalog
+
+        Args:
+            exhaustive: Score every name instead of stopping at the bounds
+        """
+        self._maybe_refresh()
+        query_norm = normalize_string(query)
+        query_words = query_norm.split()
+        index = self._index
+        results = []
+        best = []  # min-heap of the top_n scores so far
+        if exhaustive or not query_words:
+            candidates = index.songs
+        else:
+            word_matches = [(word, query_words.count(word), *self._matching_words(word))
+                            for word in set(query_words)]
+            candidates = index.candidates(query_norm, query_words, word_matches, min_score,
+                                          lambda: best[0] if len(best) == top_n > 0 else None)
+        for name, (stem, normalized, words, full_path, _) in candidates:
+            floor = min_score if exhaustive or len(best) < top_n else max(min_score, best[0])
+            score = _normalized_score(query_norm, query_words, normalized, words, floor)
+            if score >= min_score:
+                results.append((score, name, full_path))
+                if len(best) < top_n:
+                    heapq.heappush(best, score)
+                elif score > best[0]:
+                    heapq.heapreplace(best, score)
+        results.sort(reverse=True, key=lambda x: x[0])
+        return results[:top_n]
+
+    def names(self):
+        """Sorted song names (without .mid extension)"""
+        self._maybe_refresh()
+        return list(self._names)
+
+_catalog = None
+_catalog_lock = threading.Lock()
+
+def get_catalog():
+    """The shared SongCatalog for MIDI_FOLDER, created on first use"""
+    global _catalog
+    with _catalog_lock:
+        if _catalog is None or _catalog.folder != Path(MIDI_FOLDER):
+            _catalog = SongCatalog(MIDI_FOLDER)
+        return _catalog
 
 def search_song(query, top_n=5, min_score=0.3):
     """
@@ -87,32 +607,19 @@ def search_song(query, top_n=5, min_score=0.3):
         List of tuples: [(score, filename, full_path), ...]
         Sorted by score (highest first)
     """
-    midi_folder = Path(MIDI_FOLDER)
+    catalog = get_catalog()
     
     # Check if folder exists
-    if not midi_folder.exists():
+    if not catalog.exists:
         print(f"❌ Error: MIDI folder not found: {MIDI_FOLDER}")
         return []
     
-    # Get all MIDI files
-    midi_files = list(midi_folder.glob("*.mid"))
-    
-    if not midi_files:
+    if not len(catalog):
         print(f"❌ No MIDI files found in {MIDI_FOLDER}")
         return []
     
-    # Calculate scores for all files
-    results = []
-    for midi_file in midi_files:
-        score = similarity_score(query, midi_file.stem)
-        if score >= min_score:
-            results.append((score, midi_file.name, str(midi_file)))
-    
-    # Sort by score (highest first)
-    results.sort(reverse=True, key=lambda x: x[0])
-    
-    # Return top N results
-    return results[:top_n]
+    with metrics.song_search_seconds.time():
+        return catalog.search(query, top_n=top_n, min_score=min_score)
 
 def find_best_match(query):
     """
@@ -139,13 +646,7 @@ def list_all_songs():
     Returns:
         List of song names (without .mid extension)
     """
-    midi_folder = Path(MIDI_FOLDER)
-    
-    if not midi_folder.exists():
-        return []
-    
-    midi_files = list(midi_folder.glob("*.mid"))
-    return sorted([f.stem for f in midi_files])
+    return get_catalog().names()
 
 
 # Command-line interface for testing
@@ -0,0 +1,70 @@
+"""
+Stub LLM Server
+Answers OpenAI-style POST /v1/chat/completions requests after a fixed delay,
+so the voice server can be exercised offline and against slow responses.
+Point web_server.py at it with:
+
+    OPENAI_BASE_URL=http://127.0.0.1:8001/v1 OPENAI_API_KEY=stub python web_server.py
+
+Every request is answered with no_understand() (or --reply)
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def make_handler(delay, reply):
+    class StubHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive, like the real API
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            if not self.path.endswith("/chat/completions"):
+                self.send_error(404)
+                return
+            request = json.loads(body or b"{}")
+            time.sleep(delay)
+            payload = json.dumps({
+                'id': "chatcmpl-stub",
+                'object': "chat.completion",
+                'created': int(time.time()),
+                'model': request.get('model', "stub"),
+                'choices': [{
+                    'index': 0,
+                    'message': {'role': "assistant", 'content': reply},
+                    'finish_reason': "stop",
+                }],
+                'usage': {'prompt_tokens': 0, 'completion_tokens': 0, 'total_tokens': 0},
+            }).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', "application/json")
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            pass
+
+    return StubHandler
+
+
+def start_stub_server(port=8001, delay=2.0, reply="no_understand()"):
+    """Serve in a daemon thread; returns the server (call shutdown() to stop it)"""
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(delay, reply))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Slow OpenAI-compatible chat completions stub")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--delay", type=float, default=2.0, help="seconds before each answer")
+    parser.add_argument("--reply", default="no_understand()")
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), make_handler(args.delay, args.reply))
+    print(f"🤖 Stub LLM on http://127.0.0.1:{args.port}/v1 ({args.delay:.1f}s per answer)")
+    server.serve_forever()
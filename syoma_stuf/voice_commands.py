@@ -0,0 +1,167 @@
+"""
+Voice Command Parser
+Deterministic fast path for the /chat command set: common phrasings of play,
+pause, rewind/fast forward, restart, song selection and speed changes are
+turned into the same command strings the LLM produces ("rewind(-10)",
+'select_song("ode to joy")', ...) with a handful of regexes. Anything the
+grammar does not recognise returns None so the caller can fall back to the
+LLM; parser_stats counts how often the fast path answered
+"""
+import re
+import threading
+
+DEFAULT_SKIP_SECONDS = 10
+FASTER_SPEED = 1.5
+SLOWER_SPEED = 0.75
+
+parser_stats = {'fast': 0, 'fallback': 0}
+_stats_lock = threading.Lock()
+
+_NUMBER_WORDS = {
+    'a': 1, 'an': 1, 'one': 1, 'two': 2, 'three': 3, 'four': 4, 'five': 5, 'six': 6,
+    'seven': 7, 'eight': 8, 'nine': 9, 'ten': 10, 'eleven': 11, 'twelve': 12,
+    'thirteen': 13, 'fourteen': 14, 'fifteen': 15, 'sixteen': 16, 'seventeen': 17,
+    'eighteen': 18, 'nineteen': 19, 'twenty': 20, 'thirty': 30, 'forty': 40,
+    'fifty': 50, 'sixty': 60, 'half': 0.5,
+}
+_NUMBER = r"(?:\d+(?:\.\d+)?|(?:(?:twenty|thirty|forty|fifty) )?[a-z]+)"
+
+_PUNCTUATION = re.compile(r"[^\w\s.'-]+|(?<!\d)\.|\.(?!\d)")
+_SPACES = re.compile(r"\s+")
+_FILLER_START = re.compile(r"^(?:(?:hey|ok|okay|please|can you|could you|would you|will you|now|and|then|just)\s+)+")
+_FILLER_END = re.compile(r"(?:\s+(?:please|now|for me|thanks|thank you))+$")
+
+_TARGET_WORDS = r"it|this|that|the (?:music|song|track|tune|playback)|music|playback"
+_TARGET = rf"(?:\s+(?:{_TARGET_WORDS}))?"
+_PAUSE = re.compile(rf"^(?:pause|stop|halt|wait|hold on|hold it|hold up|freeze){_TARGET}$")
+_PLAY = re.compile(rf"^(?:play|start|resume|go|continue|unpause|keep going|carry on){_TARGET}"
+                   r"(?:\s+(?:again|playing))?$")
+_RESTART = re.compile(rf"^(?:restart{_TARGET}|start{_TARGET} over|(?:start|play|go back|restart){_TARGET}?"
+                      r"\s+from the (?:beginning|start|top)|from the (?:beginning|start|top)|(?:back\s+)?to the (?:beginning|start))$")
+_BACK = re.compile(rf"^(?:go back|rewind|back up|reverse|skip back(?:ward)?s?|jump back(?:ward)?s?|go backwards?|back){_TARGET}"
+                   rf"(?:\s+(?:by\s+)?(?P<amount>{_NUMBER})\s+(?P<unit>seconds?|secs?|s|minutes?|mins?))?$")
+_FORWARD = re.compile(rf"^(?:fast forward|skip ahead|skip forward|go forward|jump ahead|jump forward|forward|skip){_TARGET}"
+                      rf"(?:\s+(?:by\s+)?(?P<amount>{_NUMBER})\s+(?P<unit>seconds?|secs?|s|minutes?|mins?))?$")
+_SPEED_RELATIVE = re.compile(rf"^(?:(?:make it|play|go|a bit|a little|little bit)\s+)*(?P<word>faster|slower|quicker)"
+                             rf"(?:\s+(?:please|now))?$|^(?P<phrase>speed(?: it)? up|slow(?: it)? down){_TARGET}$")
+_SPEED_ABSOLUTE = re.compile(r"^(?:(?:set|change)(?: the)? speed to |(?:play|go)(?: it)?(?: at)? |speed )?"
+                             r"(?:(?P<factor>\d+(?:\.\d+)?)\s*x|(?P<times>\d+(?:\.\d+)?|half|double|normal|regular)"
+                             r"(?:\s+times)?)(?:\s+speed)?$")
+_SELECT = re.compile(r"^(?:play|put on|switch to|change to|play the song|play song|select|queue up|i want to hear)\s+(?P<song>.+)$")
+
+# Words that, after "play", are part of a playback command rather than a song name
+_NOT_A_SONG = re.compile(rf"^(?:{_TARGET_WORDS}|again|it again|on|something|anything|a song|some music)$")
+
+
+def normalize_utterance(text):
+    """Lowercase, strip punctuation and politeness ("hey", "please", ...) so phrasings compare equal"""
+    text = _PUNCTUATION.sub(" ", text.lower())
+    text = _SPACES.sub(" ", text).strip()
+    text = _FILLER_START.sub("", text)
+    return _FILLER_END.sub("", text)
+
+
+def _number(text):
+    """Parse "10", "2.5", "ten", "twenty five" or "half"; None if not a number"""
+    try:
+        return float(text)
+    except ValueError:
+        pass
+    total = 0
+    for word in text.split():
+        if word not in _NUMBER_WORDS:
+            return None
+        total += _NUMBER_WORDS[word]
+    return total
+
+
+def _skip_seconds(match):
+    if match.group('amount') is None:
+        return DEFAULT_SKIP_SECONDS
+    amount = _number(match.group('amount'))
+    if amount is None:
+        return None
+    if match.group('unit').startswith('m'):
+        amount *= 60
+    return int(round(amount))
+
+
+def _parse(text):
+    if not text:
+        return None
+    if _PAUSE.match(text):
+        return "pause()"
+    if _PLAY.match(text):
+        return "play()"
+    if _RESTART.match(text):
+        return "restart_song()"
+
+    match = _BACK.match(text)
+    if match:
+        seconds = _skip_seconds(match)
+        return None if seconds is None else f"rewind({-seconds})"
+    match = _FORWARD.match(text)
+    if match:
+        seconds = _skip_seconds(match)
+        return None if seconds is None else f"rewind({seconds})"
+
+    match = _SPEED_RELATIVE.match(text)
+    if match:
+        word = match.group('word') or match.group('phrase')
+        speed = SLOWER_SPEED if word.startswith('slow') else FASTER_SPEED
+        return f"set_playback_speed({speed})"
+    match = _SPEED_ABSOLUTE.match(text)
+    # A bare number after "play" is more likely a song ("play 22")
+    if match and (match.group('factor') or 'speed' in text or 'times' in text):
+        value = match.group('factor') or match.group('times')
+        speed = {'half': 0.5, 'double': 2.0, 'normal': 1.0, 'regular': 1.0}.get(value)
+        if speed is None:
+            speed = float(value)
+        if speed <= 0:
+            return None
+        return f"set_playback_speed({float(speed)})"
+
+    match = _SELECT.match(text)
+    if match:
+        song = match.group('song')
+        if song.startswith(("the song ", "song ")):
+            song = song.split(" ", 2 if song.startswith("the") else 1)[-1]
+        if _NOT_A_SONG.match(song) or '"' in song:
+            return None
+        return f'select_song("{song}")'
+    return None
+
+
+def parse_command(text):
+    """
+    Turn an utterance into a command string without calling the LLM
+
+    Returns:
+        The command in the LLM's format, or None when the utterance is not a
+        phrasing the grammar knows (the caller should ask the LLM)
+    """
+    command = _parse(normalize_utterance(text))
+    with _stats_lock:
+        parser_stats['fast' if command else 'fallback'] += 1
+    return command
+
+
+def fast_path_stats():
+    """Counts of utterances answered locally and sent to the LLM, and the hit rate"""
+    with _stats_lock:
+        total = parser_stats['fast'] + parser_stats['fallback']
+        return {**parser_stats, 'hit_rate': parser_stats['fast'] / total if total else 0.0}
+
+
+if __name__ == "__main__":
+    import sys
+    import time
+
+    for utterance in sys.argv[1:] or ["play", "pause the music", "go back 5 seconds", "fast forward",
+                                      "play bohemian rhapsody", "make it faster", "2x speed",
+                                      "start over", "what's the weather"]:
+        start = time.perf_counter()
+        command = parse_command(utterance)
+        elapsed_us = 1e6 * (time.perf_counter() - start)
+        print(f"{utterance!r:32} -> {command or '(LLM)'}  [{elapsed_us:.0f} µs]")
+    print(fast_path_stats())
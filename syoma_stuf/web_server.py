@@ -1,24 +1,48 @@
-from flask import Flask, request, jsonify, render_template
+from flask import Flask, Response, g, request, jsonify, render_template
 from flask_cors import CORS
-from openai import OpenAI
+from openai import OpenAI, Timeout, APITimeoutError
 from dotenv import load_dotenv
-from song_search import find_best_match, search_song, list_all_songs
+from song_search import find_best_match, search_song, list_all_songs, get_catalog
+from song_library import get_library
+from voice_commands import parse_command, fast_path_stats
+from command_cache import CommandCache
+from playback_events import PlaybackBroadcaster
 import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 import midi_stream_to_arduino as mid
+import metrics
 
-# Global playback state
+# Song and speed the next play uses; position and play/pause state live in
+# the current mid.PlaybackSession
 current_song_path = None
 current_playback_speed = 1.0
-current_start_time = 0.0
-is_playing = False
 
 app = Flask(__name__)
 CORS(app)  # Enable CORS for web requests
 
+# Pushes playback state changes and position ticks to every /events client
+broadcaster = PlaybackBroadcaster(mid.playback_status)
+
+@app.before_request
+def _start_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def _after_request(response):
+    # Control requests can change the playback; tell subscribers now, not at the next tick
+    if request.method == 'POST':
+        broadcaster.poke()
+    if request.path == '/chat':
+        metrics.chat_seconds.observe(time.perf_counter() - g.request_started)
+    return response
+
 # MIDI playback endpoints
 @app.route('/play', methods=['POST'])
 def play(midi_file=None, start_time=0.0, playback_speed=1.0, port="COM5", baud=115200):
-    global current_song_path, current_playback_speed, current_start_time, is_playing
+    global current_song_path, current_playback_speed
     data = request.get_json(force=True)
     # Use current_song_path if set, else default
     if midi_file is None:
@@ -31,52 +55,53 @@ def play(midi_file=None, start_time=0.0, playback_speed=1.0, port="COM5", baud=1
     baud = int(data.get("baud", baud))
 
     current_playback_speed = playback_speed
-    current_start_time = start_time
-    is_playing = True
 
     mid.play_midi(midi_file, start_time=start_time, playback_speed=playback_speed, port=port, baud=baud)
     return jsonify({"status": "playing", "file": midi_file})
 
 @app.route('/stop', methods=['POST'])
 def stop():
-    global is_playing
-    from midi_stream_to_arduino import _stop_flag, _current_thread, _lock
-    with _lock:
-        if _current_thread and _current_thread.is_alive():
-            print("🛑 Stop requested from web interface.")
-            mid._stop_flag = True
-            _current_thread.join(timeout=1.0)
-            is_playing = False
-            return jsonify({"status": "stopped"})
-    is_playing = False
+    if mid.stop_playback():
+        print("🛑 Stop requested from web interface.")
+        return jsonify({"status": "stopped"})
     return jsonify({"status": "no active playback"})
 
+def _resume_position():
+    """Where the current song was left (0 if it finished or another song played last)"""
+    status = mid.playback_status()
+    if status['file'] != str(current_song_path) or status['state'] == 'finished':
+        return 0.0
+    return status['position']
+
 # Load environment variables
 load_dotenv()
 
-app = Flask(__name__)
-CORS(app)  # Enable CORS for web requests
+# LLM calls run on a bounded pool so slow responses can't pile up threads;
+# control endpoints (/stop, /status, ...) never wait on it
+LLM_WORKERS = int(os.getenv("LLM_WORKERS", 4))
+LLM_QUEUE = int(os.getenv("LLM_QUEUE", 8))  # calls allowed to wait for a worker
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", 10.0))
 
-# Initialize OpenAI client
-client = OpenAI()
+# One client for the whole server, so its HTTP connections are pooled and
+# kept alive between calls (set OPENAI_BASE_URL to point it at a stub server)
+client = OpenAI(timeout=Timeout(LLM_TIMEOUT, connect=3.0), max_retries=1)
+_llm_pool = ThreadPoolExecutor(max_workers=LLM_WORKERS, thread_name_prefix="llm")
+_llm_slots = threading.BoundedSemaphore(LLM_WORKERS + LLM_QUEUE)
 
-@app.route('/chat', methods=['POST'])
-def chat():
-    """Parse voice commands and return function calls"""
-    global current_song_path, current_playback_speed, current_start_time, is_playing
-    try:
-        data = request.json
-        user_message = data.get('text', '').lower()
-        
-        print(f"📝 User said: {user_message}")
-        
-        # Use GPT to parse the command into function calls
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {
-                    "role": "system", 
-                    "content": """You are a voice command parser for a music player. Convert user commands into ONE of these function calls:
+# LLM answers for repeated utterances; set COMMAND_CACHE_FILE to keep them across restarts
+command_cache = CommandCache(max_entries=int(os.getenv("COMMAND_CACHE_SIZE", 1024)),
+                             ttl=float(os.getenv("COMMAND_CACHE_TTL", 24 * 3600)),
+                             path=os.getenv("COMMAND_CACHE_FILE"))
+
+def _llm_command(user_message):
+    """Ask the LLM to turn an utterance into one command call"""
+    started = time.perf_counter()
+    response = client.chat.completions.create(
+        model="gpt-4o-mini",
+        messages=[
+            {
+                "role": "system", 
+                "content": """You are a voice command parser for a music player. Convert user commands into ONE of these function calls:
 
 - play() - when user says play, start, resume, go, continue
 - pause() - when user says pause, stop, halt, wait
@@ -105,39 +130,94 @@ User: "rewind" -> rewind(-10)
 User: "play Bohemian Rhapsody" -> select_song("Bohemian Rhapsody")
 User: "make it faster" -> set_playback_speed(1.5)
 User: "what's the weather" -> no_understand()"""
-                },
-                {"role": "user", "content": user_message}
-            ],
-            max_tokens=50,
-            temperature=0.1  # Low temperature for consistent parsing
-        )
+            },
+            {"role": "user", "content": user_message}
+        ],
+        max_tokens=50,
+        temperature=0.1  # Low temperature for consistent parsing
+    )
+    metrics.llm_seconds.observe(time.perf_counter() - started)
+    return response.choices[0].message.content.strip()
+
+class LLMBusy(Exception):
+    """Every LLM worker and queue slot is taken"""
+
+def _ask_llm(user_message):
+    """
+    Run _llm_command on the LLM pool
+
+    Raises:
+        LLMBusy: when LLM_WORKERS + LLM_QUEUE calls are already in flight
+        TimeoutError: when no answer came within LLM_TIMEOUT
+    """
+    if not _llm_slots.acquire(blocking=False):
+        raise LLMBusy()
+    try:
+        future = _llm_pool.submit(_llm_command, user_message)
+    except Exception:
+        _llm_slots.release()
+        raise
+    future.add_done_callback(lambda _: _llm_slots.release())
+    return future.result(timeout=LLM_TIMEOUT)
+
+def _no_understand(status, code):
+    return jsonify({
+        'response': 'no_understand()',
+        'command': 'no_understand()',
+        'status': status
+    }), code
+
+@app.route('/chat', methods=['POST'])
+def chat():
+    """Parse voice commands and return function calls"""
+    global current_song_path, current_playback_speed
+    try:
+        data = request.json
+        user_message = data.get('text', '').lower()
+        
+        print(f"📝 User said: {user_message}")
         
-        command = response.choices[0].message.content.strip()
-        print(f"🎵 Command: {command}")
+        # Common phrasings are parsed locally; only the rest wait on the LLM
+        command = parse_command(user_message)
+        if command:
+            print(f"⚡ Command (local): {command}")
+            metrics.voice_commands.inc(parser='local')
+        else:
+            command = command_cache.get(user_message)
+            if command:
+                print(f"💾 Command (cached): {command}")
+                metrics.voice_commands.inc(parser='cache')
+            else:
+                try:
+                    command = _ask_llm(user_message)
+                except LLMBusy:
+                    print("⏳ LLM busy, command dropped")
+                    return _no_understand('busy', 503)
+                except (TimeoutError, APITimeoutError):
+                    print(f"⏳ LLM gave no answer within {LLM_TIMEOUT:.0f}s")
+                    return _no_understand('timeout', 504)
+                command_cache.put(user_message, command)
+                metrics.voice_commands.inc(parser='llm')
+                print(f"🎵 Command: {command}")
 
         # --- Handle voice command logic for Arduino/MIDI control ---
         import re
 
         # PLAY
         if command == "play()":
-            if current_song_path:
-                mid.play_midi(current_song_path, start_time=current_start_time, playback_speed=current_playback_speed, port="COM5")
-                is_playing = True
+            if mid.resume_playback():
+                print("▶️ Resumed from voice command.")
+            elif current_song_path:
+                mid.play_midi(current_song_path, start_time=_resume_position(), playback_speed=current_playback_speed, port="COM5")
             else:
                 default_midi = os.path.join(os.path.dirname(__file__), '..', 'other_folder', 'ode-to-joy.mid')
                 current_song_path = default_midi
                 mid.play_midi(current_song_path, start_time=0, playback_speed=1.0, port="COM5")
-                is_playing = True
 
         # PAUSE/STOP
         elif command == "pause()":
-            from midi_stream_to_arduino import _stop_flag, _current_thread, _lock
-            with _lock:
-                if _current_thread and _current_thread.is_alive():
-                    print("🛑 Pause requested from voice command.")
-                    mid._stop_flag = True
-                    _current_thread.join(timeout=1.0)
-                    is_playing = False
+            if mid.pause_playback():
+                print("🛑 Pause requested from voice command.")
 
         # REWIND(x) (can be negative or positive)
         elif command.startswith("rewind("):
@@ -145,29 +225,17 @@ User: "what's the weather" -> no_understand()"""
             if match:
                 seconds = int(match.group(1))
                 if current_song_path:
-                    if not is_playing:
-                        current_start_time = max(0, current_start_time + seconds)
-                    else:
-                        from midi_stream_to_arduino import _stop_flag, _current_thread, _lock
-                        with _lock:
-                            if _current_thread and _current_thread.is_alive():
-                                mid._stop_flag = True
-                                _current_thread.join(timeout=1.0)
-                        current_start_time = max(0, current_start_time + seconds)
-                        mid.play_midi(current_song_path, start_time=current_start_time, playback_speed=current_playback_speed, port="COM5")
-                        is_playing = True
+                    # Seek from where the song actually is; a paused song stays paused
+                    status = mid.playback_status()
+                    position = status['position'] if status['file'] == str(current_song_path) else 0.0
+                    start_time = max(0, position + seconds)
+                    mid.play_midi(current_song_path, start_time=start_time, playback_speed=current_playback_speed,
+                                  port="COM5", paused=status['state'] != 'playing')
 
         # RESTART SONG
         elif command == "restart_song()":
             if current_song_path:
-                from midi_stream_to_arduino import _stop_flag, _current_thread, _lock
-                with _lock:
-                    if _current_thread and _current_thread.is_alive():
-                        mid._stop_flag = True
-                        _current_thread.join(timeout=1.0)
-                current_start_time = 0
                 mid.play_midi(current_song_path, start_time=0, playback_speed=current_playback_speed, port="COM5")
-                is_playing = True
 
         # SELECT SONG
         elif command.startswith('select_song('):
@@ -180,9 +248,7 @@ User: "what's the weather" -> no_understand()"""
                     score, filename, full_path = results[0]
                     print(f"✅ Found: {filename} (match: {score:.0%})")
                     current_song_path = full_path
-                    current_start_time = 0
                     mid.play_midi(current_song_path, start_time=0, playback_speed=current_playback_speed, port="COM5")
-                    is_playing = True
 
                     # Create response with search results
                     search_info = f"Found: {filename} ({score:.0%} match)"
@@ -202,7 +268,11 @@ User: "what's the weather" -> no_understand()"""
                     })
                 else:
                     print(f"❌ Song not found: {song_query}")
-                    available_songs = list_all_songs()[:5]
+                    try:
+                        available_songs = get_library().suggest(song_query, limit=5)
+                    except sqlite3.Error as e:
+                        print(f"[Song library] Unavailable ({e}), suggesting from the folder listing")
+                        available_songs = list_all_songs()[:5]
                     return jsonify({
                         'response': command,
                         'command': 'no_understand()',
@@ -220,14 +290,10 @@ User: "what's the weather" -> no_understand()"""
             match = re.match(r"set_playback_speed\(([\d.]+)\)", command)
             if match:
                 speed = float(match.group(1))
-                current_playback_speed = speed
-                if current_song_path and is_playing:
-                    from midi_stream_to_arduino import _stop_flag, _current_thread, _lock
-                    with _lock:
-                        if _current_thread and _current_thread.is_alive():
-                            mid._stop_flag = True
-                            _current_thread.join(timeout=1.0)
-                    mid.play_midi(current_song_path, start_time=current_start_time, playback_speed=current_playback_speed, port="COM5")
+                if speed > 0:
+                    current_playback_speed = speed
+                    # Retimes the running playback in place; the next play uses it too
+                    mid.set_playback_speed(speed)
 
         return jsonify({
             'response': command,
@@ -239,11 +305,48 @@ User: "what's the weather" -> no_understand()"""
         print(f"❌ Error: {e}")
         import traceback
         traceback.print_exc()
-        return jsonify({
-            'response': 'no_understand()',
-            'command': 'no_understand()',
-            'status': 'error'
-        }), 500
+        return _no_understand('error', 500)
+
+@app.route('/songs', methods=['GET'])
+def songs():
+    """
+    Paged song listing from the library index: ?offset=&limit=, or ?prefix= / ?q= (with limit).
+    Values that are not integers fall back to the defaults
+    """
+    limit = min(max(request.args.get('limit', 50, type=int), 1), 200)
+    try:
+        library = get_library()
+        if request.args.get('prefix'):
+            rows = library.prefix(request.args['prefix'], limit)
+        elif request.args.get('q'):
+            rows = library.search(request.args['q'], limit)
+        else:
+            rows = library.page(max(request.args.get('offset', 0, type=int), 0), limit)
+        return jsonify({'total': library.count(), 'songs': rows})
+    except sqlite3.Error as e:
+        print(f"[Song library] Unavailable: {e}")
+        return jsonify({'error': f"song library unavailable: {e}", 'total': 0, 'songs': []}), 503
+
+@app.route('/chat/stats', methods=['GET'])
+def chat_stats():
+    """How many utterances the local parser and the LLM answer cache handled"""
+    return jsonify({'fast_path': fast_path_stats(), 'llm_cache': command_cache.cache_stats()})
+
+@app.route('/status', methods=['GET'])
+def status():
+    """Current playback position and state; cheap enough to poll several times a second"""
+    return jsonify(mid.playback_status())
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Latency histograms and counters in the Prometheus text format"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/events', methods=['GET'])
+def events():
+    """Server-sent playback events: "state" on song/state/speed changes, "tick" with the position while playing"""
+    return Response(broadcaster.subscribe(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 @app.route('/')
 def home():
@@ -253,11 +356,21 @@ def home():
     <p>Server is running! Open index.html in your browser to use the assistant.</p>
     """
 
+def _warm_song_indexes():
+    """Sync the library index and build the search catalog off the request path"""
+    try:
+        changes = get_library().sync()
+        print(f"📚 Song library synced: {changes}")
+    except sqlite3.Error as e:
+        print(f"[Song library] Unavailable, set SONG_LIBRARY_DB to keep it outside the MIDI folder: {e}")
+    get_catalog()
+
 if __name__ == '__main__':
+    threading.Thread(target=_warm_song_indexes, daemon=True).start()
     print("=" * 60)
     print("🚀 Starting AI Voice Assistant Web Server...")
     print("=" * 60)
     print("📱 Open index.html in Chrome to use the assistant")
     print("🌐 Server running at: http://localhost:5000")
     print("=" * 60)
-    app.run(debug=True, port=5000)
+    app.run(debug=True, port=5000, threaded=True)